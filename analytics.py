@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+
+import db
+
+# Итоги по пользователю читаются из report_stats одной строкой по первичному ключу,
+# по команде — из report_daily_stats за последние дни (см. миграцию v8 в db.py)
+USER_STATS_QUERY = """
+    SELECT u.user_id, u.username, s.first_date, s.last_date, s.days, s.total_length,
+           s.current_streak, s.longest_streak
+    FROM report_stats s
+    JOIN bot_users u ON u.user_id = s.user_id
+    WHERE s.user_id = $1
+"""
+
+TEAM_STATS_QUERY = """
+    SELECT u.user_id, u.username, s.first_date, s.last_date, s.days, s.total_length,
+           s.current_streak, s.longest_streak
+    FROM report_stats s
+    JOIN bot_users u ON u.user_id = s.user_id
+    WHERE s.last_date >= $1
+    ORDER BY lower(u.username), u.user_id
+    LIMIT $2
+"""
+
+# Знаменатель долей — все активные за период, без LIMIT из TEAM_STATS_QUERY
+ACTIVE_USERS_QUERY = """
+    SELECT count(*) FROM report_stats WHERE last_date >= $1
+"""
+
+DAILY_STATS_QUERY = """
+    SELECT date, reports FROM report_daily_stats WHERE date BETWEEN $1 AND $2 ORDER BY date
+"""
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+TEAM_STATS_LIMIT = 50
+
+
+# 📌 Производные показатели: серия считается текущей, если отчёт был сегодня или вчера
+def summarize(row, today: date) -> dict:
+    period = (today - row["first_date"]).days + 1
+    return {
+        "username": row["username"] or str(row["user_id"]),
+        "days": row["days"],
+        "missed": max(period - row["days"], 0),
+        "rate": row["days"] / period if period > 0 else 1.0,
+        "avg_length": round(row["total_length"] / row["days"]) if row["days"] else 0,
+        "streak": row["current_streak"] if (today - row["last_date"]).days <= 1 else 0,
+        "longest_streak": row["longest_streak"],
+        "last_date": row["last_date"],
+    }
+
+
+async def user_stats(user_id, today: date) -> dict | None:
+    row = await db.fetchrow(USER_STATS_QUERY, user_id)
+    return summarize(row, today) if row else None
+
+
+async def team_stats(today: date, days: int = 7) -> tuple[int, list, list]:
+    """
+    Возвращает (число активных за ``days`` дней пользователей, сводки первых
+    TEAM_STATS_LIMIT из них, [(дата, отчётов)] по дням).
+    """
+    start = today - timedelta(days=days - 1)
+    active = await db.fetchval(ACTIVE_USERS_QUERY, start)
+    users = await db.fetch(TEAM_STATS_QUERY, start, TEAM_STATS_LIMIT)
+    daily = dict(await db.fetch(DAILY_STATS_QUERY, start, today))
+    per_day = [(day, daily.get(day, 0)) for day in (start + timedelta(days=i) for i in range(days))]
+    return active, [summarize(row, today) for row in users], per_day
+
+
+def format_user_stats(stats: dict) -> str:
+    return (
+        f"📈 Статистика @{stats['username']}\n"
+        f"Отчётов: {stats['days']}, пропущено дней: {stats['missed']}\n"
+        f"Сдаёт {stats['rate']:.0%} дней (≈{stats['rate'] * 7:.1f} в неделю)\n"
+        f"Серия: {stats['streak']} дн. (рекорд {stats['longest_streak']})\n"
+        f"Средняя длина: {stats['avg_length']} симв.\n"
+        f"Последний отчёт: {stats['last_date']:%d.%m.%Y}"
+    )
+
+
+def format_team_stats(active: int, users: list, per_day: list) -> str:
+    lines = ["📊 Отчёты по дням:"]
+    for day, reports in per_day:
+        share = f" ({reports / active:.0%})" if active else ""
+        lines.append(f"  {day:%d.%m} ({WEEKDAYS[day.weekday()]}): {reports}{share}")
+    week_total = sum(reports for _, reports in per_day)
+    if active:
+        lines.append(f"За неделю: {week_total} из {active * len(per_day)} возможных")
+    lines.append("")
+    lines.append("👥 Активные за неделю:" if users else "За неделю отчётов не было.")
+    for stats in users:
+        lines.append(
+            f"@{stats['username']}: серия {stats['streak']} (рекорд {stats['longest_streak']}), "
+            f"{stats['rate']:.0%} дней, пропусков {stats['missed']}, ~{stats['avg_length']} симв."
+        )
+    if active > len(users):
+        lines.append(f"…показаны первые {len(users)} из {active}, подробнее: /stats @username")
+    return "\n".join(lines)
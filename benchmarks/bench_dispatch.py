@@ -0,0 +1,114 @@
+"""
+Микробенчмарк маршрутизации: синтетические Update прогоняются через dp.feed_update
+с фейковой сессией (без сети и без БД), считаем апдейты в секунду.
+
+Запуск:  python benchmarks/bench_dispatch.py [апдейтов на сценарий]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Бенчмарку не нужны настоящие токен и БД
+os.environ.setdefault("TOKEN", "123456:bench")
+os.environ.setdefault("DATABASE_URL", "postgresql://bench")
+os.environ["FSM_STORAGE"] = "memory"
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+import bot as telegram_bot
+
+# Логирование каждого апдейта aiogram'ом замеряло бы I/O, а не маршрутизацию
+logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+
+class FakeSession(BaseSession):
+    """Сессия, которая отвечает на любой метод Bot API без запроса в сеть."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+USER = {"id": 42, "is_bot": False, "first_name": "Bench", "username": "bench_user"}
+CHAT = {"id": 42, "type": "private"}
+
+
+def message_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(datetime.now().timestamp()), "chat": CHAT, "from": USER, "text": text},
+    }
+
+
+def callback_update(update_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": USER,
+            "chat_instance": "bench",
+            "data": data,
+            "message": {"message_id": 1, "date": int(datetime.now().timestamp()), "chat": CHAT, "text": "👤 Выбери пользователя:"},
+        },
+    }
+
+
+ROUNDS = 3
+
+# Сценарии, которые не ходят в БД: меню, отмена/редактирование отчёта, устаревшие кнопки
+SCENARIOS = {
+    "callback help": lambda i: callback_update(i, "help"),
+    "callback cancel_report": lambda i: callback_update(i, "cancel_report"),
+    "callback edit_report": lambda i: callback_update(i, "edit_report"),
+    "callback legacy user_*": lambda i: callback_update(i, "user_some_name"),
+    "message /help": lambda i: message_update(i, "/help"),
+    "message ℹ️ Помощь": lambda i: message_update(i, "ℹ️ Помощь"),
+}
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    session = FakeSession()
+    bot = Bot(token=os.environ["TOKEN"], session=session)
+    dp = telegram_bot.dp
+
+    total_updates, total_elapsed = 0, 0.0
+    for name, build in SCENARIOS.items():
+        updates = [Update.model_validate(build(i), context={"bot": bot}) for i in range(count)]
+        calls_before = session.calls
+        # Лучший из нескольких прогонов — меньше шума от планировщика ОС
+        elapsed = float("inf")
+        for _ in range(ROUNDS):
+            # update_id повторяются между прогонами — иначе их отбросит защита от повторной доставки
+            telegram_bot.deduplicate_updates.seen.clear()
+            telegram_bot.deduplicate_updates.order.clear()
+            started = time.perf_counter()
+            for update in updates:
+                await dp.feed_update(bot, update)
+            elapsed = min(elapsed, time.perf_counter() - started)
+        total_updates += count
+        total_elapsed += elapsed
+        print(f"{name:<26} {count / elapsed:>10,.0f} апдейтов/с   API-вызовов за прогон: {(session.calls - calls_before) // ROUNDS}")
+
+    print(f"{'итого':<26} {total_updates / total_elapsed:>10,.0f} апдейтов/с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
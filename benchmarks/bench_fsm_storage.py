@@ -0,0 +1,66 @@
+"""
+Сравнение PostgresStorage и MemoryStorage на типичном цикле обработчика:
+get_state -> get_data -> update_data -> set_state.
+
+Запуск:  DATABASE_URL=postgresql://... python benchmarks/bench_fsm_storage.py [итераций] [пользователей]
+Без DATABASE_URL измеряется только MemoryStorage.
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import db
+from fsm_storage import PostgresStorage
+
+
+async def run(storage, iterations: int, users: int) -> float:
+    keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(users)]
+    started = time.perf_counter()
+    for i in range(iterations):
+        key = keys[i % users]
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.update_data(key, {"report_text": f"отчёт {i}", "append_mode": False})
+        await storage.set_state(key, "ReportState:waiting_for_confirmation")
+    return time.perf_counter() - started
+
+
+def report(name: str, iterations: int, elapsed: float):
+    print(f"{name:<28} {iterations / elapsed:>12,.0f} циклов/с   {elapsed / iterations * 1e6:>8.1f} мкс/цикл")
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    report("MemoryStorage", iterations, await run(MemoryStorage(), iterations, users))
+
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        print("DATABASE_URL не задан — PostgresStorage пропущен")
+        return
+
+    await db.init_pool(dsn)
+    try:
+        await db.migrate()
+        storage = PostgresStorage()
+        # Холодный кэш: каждое первое обращение к пользователю читает БД
+        report("PostgresStorage (холодный)", iterations, await run(storage, iterations, users))
+        # Тёплый кэш: обращения не выходят в сеть
+        report("PostgresStorage (тёплый)", iterations, await run(storage, iterations, users))
+        started = time.perf_counter()
+        await storage.close()
+        print(f"Сброс {users} записей в БД: {(time.perf_counter() - started) * 1000:.1f} мс")
+        await db.execute("DELETE FROM fsm_storage WHERE key LIKE 'fsm:1:%'")
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
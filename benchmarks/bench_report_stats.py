@@ -0,0 +1,132 @@
+"""
+/stats на синтетической истории: полный пересчёт по reports против чтения
+из report_stats/report_daily_stats, плюс цена поддержки статистики при записи отчёта.
+
+Данные генерируются в отдельной схеме (по умолчанию 1000 пользователей × 1000 дней,
+~1M строк) и удаляются после прогона.
+
+Запуск:  DATABASE_URL=postgresql://... python benchmarks/bench_report_stats.py [пользователей] [дней]
+"""
+import os
+import sys
+import time
+import asyncio
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Генерация ~1M строк и полный пересчёт не укладываются в обычный таймаут запроса
+os.environ.setdefault("DB_COMMAND_TIMEOUT", "1800")
+
+import asyncpg
+
+import db
+import analytics
+
+SCHEMA = "bench_report_stats"
+ITERATIONS = 200
+WRITES = 2_000
+
+# То, что пришлось бы считать без report_stats: острова подряд идущих дней по всей таблице
+FULL_SCAN_QUERY = """
+    SELECT user_id, min(first_date), max(last_date), sum(days), sum(total_length),
+           (array_agg(days ORDER BY last_date DESC))[1], max(days)
+    FROM (
+        SELECT user_id, min(date) AS first_date, max(date) AS last_date, count(*) AS days,
+               sum(length(text)) AS total_length
+        FROM (
+            SELECT user_id, date, text,
+                   date - (row_number() OVER (PARTITION BY user_id ORDER BY date))::int AS island
+            FROM reports
+        ) d
+        GROUP BY user_id, island
+    ) islands
+    GROUP BY user_id
+"""
+
+# ~90% дней с отчётом, длина текста 20–400 символов
+GENERATE_REPORTS = """
+    INSERT INTO reports (user_id, username, text, date)
+    SELECT u, 'user_' || u, repeat('x', 20 + (hashint % 380)), $2::date - d
+    FROM generate_series(1, $1::int) u,
+         generate_series(1, $3::int) d,
+         LATERAL (SELECT abs(hashtext(u || ':' || d)) AS hashint) h
+    WHERE hashint % 10 <> 0
+"""
+
+
+def with_search_path(dsn: str) -> str:
+    return dsn + ("&" if "?" in dsn else "?") + f"search_path={SCHEMA}"
+
+
+async def timed(name: str, iterations: int, func):
+    started = time.perf_counter()
+    for i in range(iterations):
+        await func(i)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {elapsed / iterations * 1000:>10.2f} мс/вызов")
+    return elapsed
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        print("Нужен DATABASE_URL")
+        return
+
+    admin = await asyncpg.connect(dsn)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    await db.init_pool(with_search_path(dsn))
+    today = date.today()
+    try:
+        await db.migrate()
+        await db.execute(
+            "INSERT INTO bot_users (user_id, username) SELECT u, 'user_' || u FROM generate_series(1, $1::int) u",
+            users,
+        )
+
+        # Загрузка без триггера, затем тот же пересчёт, что делает миграция v8
+        await db.execute("ALTER TABLE reports DISABLE TRIGGER reports_stats")
+        started = time.perf_counter()
+        await db.execute(GENERATE_REPORTS, users, today, days)
+        await db.execute("ANALYZE reports")
+        rows = await db.fetchval("SELECT count(*) FROM reports")
+        print(f"Сгенерировано {rows:,} отчётов за {time.perf_counter() - started:.1f} с")
+
+        started = time.perf_counter()
+        await db.execute("""
+            INSERT INTO report_daily_stats (date, reports, total_length)
+            SELECT date, count(*), sum(length(text)) FROM reports GROUP BY date
+        """)
+        await db.execute("SELECT recompute_report_stats(u) FROM generate_series(1, $1::int) u", users)
+        print(f"Первичный расчёт статистики: {time.perf_counter() - started:.1f} с")
+        await db.execute("ALTER TABLE reports ENABLE TRIGGER reports_stats")
+
+        print()
+        await timed("Полный пересчёт по reports", 3, lambda i: db.fetch(FULL_SCAN_QUERY))
+        await timed("/stats @user (report_stats)", ITERATIONS,
+                    lambda i: analytics.user_stats(i % users + 1, today))
+        await timed("/stats (report_stats + по дням)", ITERATIONS, lambda i: analytics.team_stats(today))
+
+        # Запись за завтра — ветка инкремента; затем дописывание (ON CONFLICT DO UPDATE)
+        print()
+        tomorrow = today + timedelta(days=1)
+        count = min(WRITES, users)
+        await timed("Новый отчёт с триггером", count,
+                    lambda i: db.upsert_report(i + 1, f"user_{i + 1}", "новый отчёт", tomorrow))
+        await timed("Дописывание с триггером", count,
+                    lambda i: db.upsert_report(i + 1, f"user_{i + 1}", "ещё", tomorrow, append=True))
+        await db.execute("ALTER TABLE reports DISABLE TRIGGER reports_stats")
+        day_after = tomorrow + timedelta(days=1)
+        await timed("Новый отчёт без триггера", count,
+                    lambda i: db.upsert_report(i + 1, f"user_{i + 1}", "новый отчёт", day_after))
+    finally:
+        await db.close_pool()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
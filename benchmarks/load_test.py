@@ -0,0 +1,212 @@
+"""
+Нагрузочный тест без Telegram: бот ходит через настоящую AiohttpSession в локальный
+фейковый Bot API (aiohttp-сервер в этом же процессе), данные — в локальном Postgres
+в отдельной схеме, которая удаляется после прогона.
+
+Каждый виртуальный пользователь проигрывает диалог:
+/start -> «Сообщить отчёт» -> текст -> «Подтвердить» -> /get -> выбор пользователя -> выбор даты.
+Одновременно идут ``concurrency`` диалогов. В конце печатаются p50/p99 обработки по шагам,
+апдейты в секунду, число вызовов Bot API и запросов к БД (по метрикам metrics.py).
+
+Запуск:  DATABASE_URL=postgresql://localhost/postgres python benchmarks/load_test.py [пользователей] [одновременно]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import statistics
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCHEMA = "bench_load_test"
+DSN = os.getenv("DATABASE_URL")
+if not DSN:
+    sys.exit("Нужен DATABASE_URL локального Postgres (например, postgresql://postgres@localhost/postgres)")
+
+# Токен фейковый, планировщик не нужен, всё пишется в отдельную схему
+os.environ["TOKEN"] = "123456:load-test"
+os.environ["DATABASE_URL"] = DSN + ("&" if "?" in DSN else "?") + f"search_path={SCHEMA}"
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+import asyncpg
+from aiohttp import web
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+import bot as telegram_bot
+import metrics
+from handlers.common import DatePick, UserPick, today
+
+logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+USER_ID_BASE = 10_000_000
+
+
+class FakeBotApi:
+    """Отвечает на методы Bot API правдоподобными объектами и считает вызовы."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.message_id = 0
+        self.runner: web.AppRunner | None = None
+
+    def message(self, chat_id, text=None):
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text or "",
+        }
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await request.post()
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot"}
+        elif method.startswith(("send", "edit")):
+            result = self.message(params.get("chat_id", 0), params.get("text"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def user_of(n):
+    return {"id": USER_ID_BASE + n, "is_bot": False, "first_name": f"Load {n}", "username": f"load_user_{n}"}
+
+
+def message_update(n, text):
+    user = user_of(n)
+    return {
+        "message": {
+            "message_id": 1, "date": int(datetime.now().timestamp()),
+            "chat": {"id": user["id"], "type": "private"}, "from": user, "text": text,
+        },
+    }
+
+
+def callback_update(n, data):
+    user = user_of(n)
+    return {
+        "callback_query": {
+            "id": str(n), "from": user, "chat_instance": "load", "data": data,
+            "message": {
+                "message_id": 1, "date": int(datetime.now().timestamp()),
+                "chat": {"id": user["id"], "type": "private"}, "text": "…",
+            },
+        },
+    }
+
+
+def conversation(n):
+    user_id = USER_ID_BASE + n
+    return [
+        ("/start", message_update(n, "/start")),
+        ("report", callback_update(n, "report")),
+        ("report text", message_update(n, f"Нагрузочный отчёт пользователя {n}: задачи, созвоны, ревью")),
+        ("confirm_report", callback_update(n, "confirm_report")),
+        ("/get", message_update(n, "/get load_user")),
+        ("select user", callback_update(n, UserPick(user_id=user_id).pack())),
+        ("select date", callback_update(n, DatePick(user_id=user_id, day=today().strftime("%Y%m%d")).pack())),
+    ]
+
+
+def db_query_counts() -> Counter:
+    counts = Counter()
+    for family in metrics.DB_QUERY_LATENCY.collect():
+        for sample in family.samples:
+            if sample.name.endswith("_count"):
+                counts[sample.labels["statement"]] += int(sample.value)
+    return counts
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run_user(n, bot, dp, latencies, errors, update_ids):
+    for step, payload in conversation(n):
+        update = Update.model_validate({"update_id": next(update_ids), **payload}, context={"bot": bot})
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            errors[f"{step}: {type(e).__name__}"] += 1
+        latencies[step].append(time.perf_counter() - started)
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    admin = await asyncpg.connect(DSN)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    api = FakeBotApi()
+    bot, dp = telegram_bot.bot, telegram_bot.dp
+    bot.session.api = TelegramAPIServer.from_base(await api.start())
+    try:
+        await telegram_bot.on_startup()
+        queries_before = db_query_counts()
+        latencies = defaultdict(list)
+        errors = Counter()
+        update_ids = iter(range(1, sys.maxsize))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(n):
+            async with semaphore:
+                await run_user(n, bot, dp, latencies, errors, update_ids)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+        # Отложенная запись отчётов тоже считается в запросы
+        await telegram_bot.report_writer.flush()
+        queries = db_query_counts() - queries_before
+    finally:
+        # Закрывает хранилище FSM, сессию бота и пул БД (см. lifecycle.py)
+        await telegram_bot.on_shutdown()
+        await api.stop()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n{users} диалогов, одновременно {concurrency}: {total} апдейтов за {elapsed:.2f} с "
+          f"= {total / elapsed:,.0f} апдейтов/с\n")
+    for error, count in errors.most_common():
+        print(f"⚠️ Ошибка {error}: {count}")
+    print(f"{'шаг':<16} {'p50, мс':>9} {'p99, мс':>9}")
+    for step, _ in conversation(0):
+        values = latencies[step]
+        print(f"{step:<16} {percentile(values, 50) * 1000:>9.1f} {percentile(values, 99) * 1000:>9.1f}")
+    everything = [value for values in latencies.values() for value in values]
+    print(f"{'все':<16} {percentile(everything, 50) * 1000:>9.1f} {percentile(everything, 99) * 1000:>9.1f}")
+
+    print(f"\nВызовы Bot API: {sum(api.calls.values())} ({sum(api.calls.values()) / total:.2f} на апдейт)")
+    for method, count in api.calls.most_common():
+        print(f"  {method:<24} {count}")
+    print(f"Запросы к БД: {sum(queries.values())} ({sum(queries.values()) / total:.2f} на апдейт)")
+    for statement, count in queries.most_common():
+        print(f"  {statement:<24} {count}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,57 +1,53 @@
 import os
 import logging
-import psycopg2
 import asyncio
-import asyncpg
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import ChatMemberUpdated
-from datetime import datetime, timedelta
-import locale
-
-# Устанавливаем русский язык для дней недели
-locale.setlocale(locale.LC_TIME, "ru_RU.UTF-8")
+import db
+import cache
+import handlers
+import exports
+import metrics
+import reminders
+from lifecycle import Lifecycle, DeduplicateUpdatesMiddleware, drain_updates, supervise
+from report_writer import writer as report_writer
+from aiogram import Bot, Dispatcher
 
 # ✅ Читаем переменные окружения
 TOKEN = os.getenv("TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Где хранить состояния FSM: postgres (переживает перезапуск) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+# Запускать ли планировщик напоминаний в этом процессе
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
 
 if not TOKEN or not DATABASE_URL:
     raise ValueError("Не заданы переменные окружения TOKEN и DATABASE_URL")
 
-# Подключаемся к PostgreSQL
-async def get_db_connection():
-    return await asyncpg.connect(DATABASE_URL)
+# Создаём таблицы и накатываем миграции схемы (см. db.MIGRATIONS)
+async def create_tables():
+    await db.migrate()
 
-async def execute_query(query, *args):
-    conn = await get_db_connection()
-    try:
-        return await conn.fetch(query, *args)
-    finally:
-        await conn.close()
 
-# Создаём таблицу, если её нет
-async def create_tables():
-    query = """
-        CREATE TABLE IF NOT EXISTS reports (
-            id SERIAL PRIMARY KEY,
-            user_id BIGINT,
-            username TEXT,
-            text TEXT,
-            date TEXT
-        )
-    """
-    await execute_query(query)
+def create_storage():
+    # Импортируем только выбранное хранилище
+    if FSM_STORAGE == "postgres":
+        from fsm_storage import PostgresStorage
+        return PostgresStorage()
+    if db.MULTI_PROCESS:
+        raise ValueError("FSM_STORAGE=memory нельзя использовать при WEB_CONCURRENCY>1: состояние не общее для процессов")
+    from aiogram.fsm.storage.memory import MemoryStorage
+    return MemoryStorage()
+
 
 # Инициализируем бота
 bot = Bot(token=TOKEN)
-dp = Dispatcher()
-scheduler = AsyncIOScheduler()
+dp = Dispatcher(storage=create_storage())
+# Планировщик APScheduler нужен только для дайджеста и создаётся в on_startup
+scheduler = None
+# Ресурсы процесса (пул БД, HTTP-сессия, фоновые задачи) — см. lifecycle.py
+lifecycle = Lifecycle()
+deduplicate_updates = DeduplicateUpdatesMiddleware()
+# Персональные напоминания (время, часовой пояс и дни недели — в reminder_settings)
+reminder_scheduler = reminders.ReminderScheduler(bot)
 
 # Логирование
 logging.basicConfig(level=logging.INFO)
@@ -59,311 +55,13 @@ logging.basicConfig(level=logging.INFO)
 # Список пользователей
 users = set()
 
-# 📌 Главное меню кнопок
-# Меню для ЛС (inline-кнопки)
-menu_keyboard_private = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text="📢 Сообщить отчёт", callback_data="report")],
-    [InlineKeyboardButton(text="📊 Запросить отчёт", callback_data="get")],
-    [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")]
-])
-
-# Меню для групп (обычные кнопки)
-menu_keyboard_group = ReplyKeyboardMarkup(
-    keyboard=[
-        [KeyboardButton(text="📢 Сообщить отчёт"), KeyboardButton(text="📊 Запросить отчёт")],
-        [KeyboardButton(text="ℹ️ Помощь")]
-    ],
-    resize_keyboard=True
-)
-
-
-
-class ReportState(StatesGroup):
-    waiting_for_confirmation = State()
-    waiting_for_report = State()
-
-
-
-# 📌 Команда /start
-async def start_command(message: Message):
-    keyboard = menu_keyboard_private if message.chat.type == "private" else menu_keyboard_group
-    await message.answer("Привет! Я буду спрашивать тебя каждый день, что ты делал.\n\nВыбери команду ниже:", reply_markup=keyboard)
-
-
-
-
-# 📌 Команда /report (или кнопка "📢 Сообщить отчёт")
-async def report_command(message: Message, state: FSMContext):
-    keyboard = menu_keyboard_private if message.chat.type == "private" else menu_keyboard_group
-    await message.answer("✏️ Напиши, что ты сегодня делал...", reply_markup=keyboard)
-    await state.set_state(ReportState.waiting_for_report)
-
-
-
-async def handle_report_text(message: Message, state: FSMContext):
-    current_state = await state.get_state()
-    if current_state != ReportState.waiting_for_report.state:
-        return
-
-    user_data = await state.get_data()
-    append_mode = user_data.get("append_mode", False)
-
-    existing_report = await execute_query(
-        "SELECT text FROM reports WHERE user_id = $1 AND date = $2",
-        message.from_user.id, datetime.now().strftime("%Y-%m-%d")
-    )
-
-    if existing_report:
-        existing_report = existing_report[0]["text"]  # Получаем строку текста
-
-    if append_mode and existing_report:
-        new_text = existing_report + "\n" + message.text.strip()
-        await execute_query(
-            "UPDATE reports SET text = $1 WHERE user_id = $2 AND date = $3",
-            new_text, message.from_user.id, datetime.now().strftime("%Y-%m-%d")
-        )
-
-        keyboard = menu_keyboard_private if message.chat.type == "private" else menu_keyboard_group
-        await message.answer("✅ Твой отчёт дополнен!", reply_markup=keyboard)
-        await state.clear()
-        return
-
-
-    # 🟢 Клавиатура выбора действия (изменить, добавить, отмена)
-    edit_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✏️ Изменить отчёт", callback_data="edit_existing_report")],
-        [InlineKeyboardButton(text="➕ Добавить к отчёту", callback_data="add_to_report")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_report")]
-    ])
-
-    if existing_report:
-        await message.answer("⚠️ У тебя уже есть отчёт за сегодня. Что ты хочешь сделать?", reply_markup=edit_keyboard)
-        return
-
-    # 🟢 Создаём новый отчёт
-    text = message.text.strip()
-    await state.update_data(report_text=text, append_mode=False)
-
-    confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_report")],
-        [InlineKeyboardButton(text="✏️ Редактировать", callback_data="edit_report")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_report")]
-    ])
-
-    await message.answer(f"📄 Твой отчёт:\n\n{text}\n\nТы подтверждаешь?", reply_markup=confirm_keyboard)
-    await state.set_state(ReportState.waiting_for_confirmation)
-
-
-# 📌 Команда /get (или кнопка "📊 Запросить отчёт")
-async def get_report_command(message: Message):
-    try:
-        users_from_db = await execute_query("SELECT DISTINCT username FROM reports WHERE username IS NOT NULL")
-
-
-        if not users_from_db:
-            await message.answer("❌ Нет доступных пользователей.")
-            return
-
-        buttons = [InlineKeyboardButton(text=f"@{user[0]}", callback_data=f"user_{user[0]}") for user in users_from_db]
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons])
-        await message.answer("👤 Выбери пользователя:", reply_markup=keyboard)
-
-    except Exception as e:
-        logging.error(f"Ошибка БД: {e}")
-        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
-
-
-# 📌 Обработчик выбора пользователя
-@dp.callback_query(lambda c: c.data.startswith("user_"))
-async def select_user(callback: types.CallbackQuery):
-    username = callback.data.replace("user_", "")
-
-    # Генерируем кнопки с последними 7 датами
-    dates = [(datetime.now() - timedelta(days=i)) for i in range(7)]
-    buttons = [
-        InlineKeyboardButton(
-            text=date.strftime("%d %b (%a)"),  # Формат: "31 Янв (Ср)"
-            callback_data=f"date_{username}_{date.strftime('%Y-%m-%d')}"
-        )
-        for date in dates
-    ]
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons])
-    await callback.message.answer(
-        f"📅 Выбран пользователь: @{username}\nВыбери дату отчёта:", 
-        reply_markup=keyboard
-    )
-
-# 📌 Обработчик выбора даты
-@dp.callback_query(lambda c: c.data.startswith("date_"))
-async def select_date(callback: types.CallbackQuery):
-    _, username, date = callback.data.split("_")
-
-    record = await execute_query(
-        "SELECT text FROM reports WHERE username = $1 AND date = $2",
-        username, date
-        )
-
-    if record:
-        await callback.message.answer(f"📝 Отчёт @{username} за {date}:\n{record[0]['text']}")
-    else:
-        await callback.message.answer(f"❌ Нет отчётов @{username} за {date}.")
-
-        if record:
-            await callback.message.answer(f"📝 Отчёт @{username} за {date}:\n{record[0]}")
-        else:
-            await callback.message.answer(f"❌ Нет отчётов @{username} за {date}.")
-
-
-@dp.callback_query(lambda c: c.data == "confirm_report")
-async def confirm_report(callback: types.CallbackQuery, state: FSMContext):
-    user_data = await state.get_data()
-    new_text = user_data.get("report_text")
-    append_mode = user_data.get("append_mode", False)
-
-    existing_report = await execute_query(
-        "SELECT text FROM reports WHERE user_id = $1 AND date = $2",
-        callback.from_user.id, datetime.now().strftime("%Y-%m-%d")
-    )
-
-    if existing_report:
-        existing_report = existing_report[0]["text"]
-
-    if existing_report and append_mode:
-        updated_text = existing_report + "\n" + new_text
-        await execute_query(
-            "UPDATE reports SET text = $1 WHERE user_id = $2 AND date = $3",
-            updated_text, callback.from_user.id, datetime.now().strftime("%Y-%m-%d")
-        )
-    else:
-        await execute_query(
-            "INSERT INTO reports (user_id, username, text, date) VALUES ($1, $2, $3, $4)",
-            callback.from_user.id, callback.from_user.username, new_text, datetime.now().strftime("%Y-%m-%d")
-        )
-
-    keyboard = menu_keyboard_private if callback.message.chat.type == "private" else menu_keyboard_group
-    await callback.message.answer("✅ Отчёт записан!", reply_markup=keyboard)
-    await state.clear()
-    await callback.answer()
+# 📌 Еженедельный дайджест (в чат DIGEST_CHAT_ID); повторную отправку другим процессом
+# отсекает отметка в digest_runs (см. exports.weekly_digest)
+@metrics.timed_job("digest_task")
+async def digest_task():
+    await exports.weekly_digest(bot, handlers.common.today())
 
 
-
-
-@dp.callback_query(lambda c: c.data == "cancel_report")
-async def cancel_report(callback: types.CallbackQuery, state: FSMContext):
-    await state.clear()  # 🟢 Сбрасываем состояние
-    keyboard = menu_keyboard_private if callback.message.chat.type == "private" else menu_keyboard_group
-    await callback.message.answer("🚫 Действие отменено.", reply_markup=keyboard)
-    await callback.answer()
-
-
-
-@dp.callback_query(lambda c: c.data == "edit_report")
-async def edit_report(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.answer("✏️ Напиши новый отчёт:")
-    await state.clear()
-    await callback.answer()
-
-
-@dp.callback_query(lambda c: c.data == "edit_existing_report")
-async def edit_existing_report(callback: types.CallbackQuery, state: FSMContext):
-    await execute_query(
-    "DELETE FROM reports WHERE user_id = $1 AND date = $2",
-    callback.from_user.id, datetime.now().strftime("%Y-%m-%d")
-)
-
-
-    await state.clear()  # Удаляем все состояния, чтобы не зависнуть в старых данных
-    await callback.message.answer("✏️ Напиши новый отчёт:")
-    await state.set_state(ReportState.waiting_for_confirmation)
-    await callback.answer()
-
-
-
-@dp.callback_query(lambda c: c.data == "add_to_report")
-async def add_to_report(callback: types.CallbackQuery, state: FSMContext):
-    existing_report = await execute_query(
-        "SELECT text FROM reports WHERE user_id = $1 AND date = $2",
-        callback.from_user.id, datetime.now().strftime("%Y-%m-%d")
-    )
-
-    if existing_report:
-        existing_report = existing_report[0]["text"]  # Получаем строку текста
-        await state.update_data(report_text=existing_report, append_mode=True)  # 🟢 Теперь без ошибки!
-        await callback.message.answer("✏️ Напиши, что хочешь добавить к отчёту:")
-        await state.set_state(ReportState.waiting_for_report)
-    else:
-        await callback.message.answer("⚠️ Ошибка: нет отчёта для дополнения.")
-
-    await callback.answer()
-
-
-
-
-
-
-# 📌 Команда /help
-async def help_command(message: Message):
-    keyboard = menu_keyboard_private if message.chat.type == "private" else menu_keyboard_group
-    await message.answer("📌 Доступные команды:\n"
-                         "/report – Записать отчёт о дне\n"
-                         "/get – Запросить отчёт (выбор кнопками)\n"
-                         "/start – Перезапустить бота", reply_markup=keyboard)
-
-
-
-# 📌 Функция отправки ежедневного запроса
-async def daily_task():
-    cur.execute("SELECT DISTINCT user_id FROM reports")
-    users_from_db = cur.fetchall()
-    for user in users_from_db:
-        try:
-            await bot.send_message(user[0], "📝 Что ты сегодня делал? Напиши /report")
-        except Exception as e:
-            logging.error(f"Ошибка отправки уведомления: {e}")
-
-
-@dp.callback_query(F.data == "report")
-async def report_callback(callback: types.CallbackQuery, state: FSMContext):
-    await callback.answer()  # Чтобы убрать "часики" загрузки
-    await report_command(callback.message, state)
-
-@dp.callback_query(F.data == "get")
-async def get_callback(callback: types.CallbackQuery):
-    await callback.answer()
-    await get_report_command(callback.message)
-
-@dp.callback_query(F.data == "help")
-async def help_callback(callback: types.CallbackQuery):
-    await callback.answer()
-    await help_command(callback.message)
-
-
-@dp.message(F.text == "📢 Сообщить отчёт")
-async def report_text_command(message: Message, state: FSMContext):
-    await report_command(message, state)
-
-@dp.message(F.text == "📊 Запросить отчёт")
-async def get_text_command(message: Message):
-    await get_report_command(message)
-
-@dp.message(F.text == "ℹ️ Помощь")
-async def help_text_command(message: Message):
-    await help_command(message)
-
-
-
-
-@dp.chat_member()
-async def bot_added_to_group(event: ChatMemberUpdated):
-    if event.new_chat_member and event.new_chat_member.user.id == bot.id:
-        logging.info(f"Бот добавлен в группу: {event.chat.id}")
-        await bot.send_message(
-            event.chat.id,
-            "Привет! Теперь ты можешь отправлять отчёты прямо из группы. Выбери команду ниже:",
-            reply_markup=menu_keyboard_group  # 💡 Исправил!
-        )
-
 async def keep_awake():
     while True:
         try:
@@ -374,47 +72,85 @@ async def keep_awake():
         await asyncio.sleep(300)  # Ждать 5 минут
 
 
-async def on_shutdown():
-    cur.close()
-    conn.close()
-    logging.info("Бот остановлен. Соединение с БД закрыто.")
-
-async def main():
-    await create_tables()  # Создаём таблицы перед запуском бота
-
-    dp.message.register(start_command, Command("start"))
-    dp.message.register(report_command, Command("report"))
-    dp.message.register(get_report_command, Command("get"))
-    dp.message.register(help_command, Command("help"))
-    dp.message.register(handle_report_text, ReportState.waiting_for_report)  # 💡 Хендлер состояния теперь определён
+# Хендлеры разбиты по роутерам (см. handlers/)
+dp.include_routers(*handlers.routers)
+dp.update.outer_middleware(deduplicate_updates)
+# Метрики хендлеров, запросов к Bot API и медленных апдейтов (см. metrics.py)
+metrics.setup(dp, bot)
 
-    dp.callback_query.register(select_user)
-    dp.callback_query.register(select_date)
-    dp.callback_query.register(confirm_report)
-    dp.callback_query.register(edit_report)
-    dp.callback_query.register(edit_existing_report)
-    dp.callback_query.register(add_to_report)
 
-    scheduler.add_job(daily_task, "cron", hour=18)
-    scheduler.start()
+# 📌 Общий запуск/остановка ресурсов для polling и webhook (см. webhook.py).
+# Всё, что открыто здесь, закрывается в on_shutdown в обратном порядке
+async def on_startup():
+    global scheduler
+    try:
+        await db.init_pool(DATABASE_URL)
+        lifecycle.on_close("пул БД", db.close_pool)
+        await create_tables()  # Создаём таблицы перед запуском бота
+        await deduplicate_updates.load()
+        lifecycle.start_task("processed_updates", deduplicate_updates.flush_loop)
+        # Закрывается раньше пула БД (обратный порядок): остаток отметок успевает записаться
+        lifecycle.on_close("отметки обработанных апдейтов", deduplicate_updates.flush)
+        lifecycle.on_close("HTTP-сессия бота", bot.session.close)
+        lifecycle.on_close("хранилище FSM", dp.storage.close)
+        # Дописываем в БД отчёты, которые ещё в очереди
+        lifecycle.on_close("очередь записи отчётов", report_writer.close)
+
+        if SCHEDULER_ENABLED:
+            reminder_scheduler.start()
+            lifecycle.on_close("напоминания", reminder_scheduler.stop)
+            if exports.DIGEST_CHAT_ID and scheduler is None:
+                from apscheduler.schedulers.asyncio import AsyncIOScheduler
+                scheduler = AsyncIOScheduler()
+                scheduler.add_job(
+                    digest_task, "cron", day_of_week="mon", hour=9, id="digest_task", replace_existing=True,
+                    max_instances=1, coalesce=True, misfire_grace_time=3600
+                )
+                scheduler.start()
+                lifecycle.on_close("планировщик", stop_scheduler)
+
+        metrics.start_profiler_if_configured()
+    except Exception:
+        await lifecycle.close()
+        raise
+    logging.info(f"✅ Подключённые роутеры: {[router.name for router in dp.sub_routers]}")
+
+
+async def stop_scheduler():
+    global scheduler
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    scheduler = None
 
-    asyncio.create_task(keep_awake())
 
-    logging.info(f"✅ Зарегистрированные хендлеры: {dp.message.handlers}")
+async def on_shutdown():
+    logging.info(f"📦 Статистика кэша: {cache.stats()}")
+    await lifecycle.close()
+    logging.info("Бот остановлен. Соединение с БД закрыто.")
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, drop_pending_updates=True)
 
+async def main():
+    # Нет БД или сети при старте — повторяем с растущей паузой, а не падаем
+    await supervise("startup", on_startup)
+    metrics.start_metrics_server()
+    # Пинг нужен только в polling-режиме; в webhook-режиме бот будят входящие запросы
+    lifecycle.start_task("keep_awake", keep_awake)
     try:
-        await dp.start_polling(bot)
+        # Накопившиеся за время перезапуска апдейты не выбрасываем
+        await bot.delete_webhook(drop_pending_updates=False)
+        # SIGTERM/SIGINT останавливают polling штатно; падение — перезапуск без повторной инициализации
+        await supervise("polling", lambda: dp.start_polling(bot, close_bot_session=False))
+        # Предыдущие пачки aiogram подтвердил, запрашивая следующую: если апдейт из них не успел
+        # обработаться за SHUTDOWN_DRAIN_TIMEOUT, он потерян (это пишется в лог). Последнюю пачку
+        # подтверждаем только целиком обработанной, иначе она придёт снова после рестарта, а уже
+        # обработанные из неё апдейты отсечёт processed_updates (см. DeduplicateUpdatesMiddleware)
+        drained = await drain_updates(dp)
+        offset = deduplicate_updates.confirmed_offset()
+        if drained and offset:
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
     finally:
         await on_shutdown()
 
 
 if __name__ == "__main__":
-    while True:
-        try:
-            asyncio.run(main())  # ✅ Запускаем всё внутри main()
-        except Exception as e:
-            logging.error(f"Бот упал с ошибкой: {e}")
-            asyncio.sleep(5)
+    asyncio.run(main())  # ✅ Запускаем всё внутри main()
@@ -0,0 +1,183 @@
+import os
+import time
+from collections import OrderedDict
+
+import db
+import metrics
+
+# Размеры и время жизни кэшей (можно переопределить через переменные окружения)
+USERS_CACHE_SIZE = int(os.getenv("USERS_CACHE_SIZE", "256"))
+USERS_CACHE_TTL = float(os.getenv("USERS_CACHE_TTL", "300"))
+REPORTS_CACHE_SIZE = int(os.getenv("REPORTS_CACHE_SIZE", "5000"))
+# При нескольких процессах запись из другого процесса не сбрасывает этот кэш — отчёты не кэшируем
+REPORTS_CACHE_TTL = float(os.getenv("REPORTS_CACHE_TTL", "0" if db.MULTI_PROCESS else "600"))
+
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с ограничением по размеру и временем жизни записей; счётчики видны и на /metrics."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_metric = metrics.CACHE_REQUESTS.labels(name, "hit")
+        self._miss_metric = metrics.CACHE_REQUESTS.labels(name, "miss")
+        self._eviction_metric = metrics.CACHE_EVICTIONS.labels(name)
+        self._entries_metric = metrics.CACHE_ENTRIES.labels(name)
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                self._hit_metric.inc()
+                return value
+            del self.data[key]
+            self._entries_metric.set(len(self.data))
+        self.misses += 1
+        self._miss_metric.inc()
+        return MISSING
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        self.data[key] = (value, time.monotonic() + self.ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+            self._eviction_metric.inc()
+        self._entries_metric.set(len(self.data))
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+        self._entries_metric.set(len(self.data))
+
+    def clear(self):
+        self.data.clear()
+        self._entries_metric.set(0)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# Страницы списка пользователей для /get и тексты отчётов по (user_id, date).
+# Кэш локален для процесса: в других процессах запись устаревает не дольше TTL
+# (список пользователей — не дольше USERS_CACHE_TTL, отчёты при нескольких процессах не кэшируются)
+users_cache = TTLCache("users", maxsize=USERS_CACHE_SIZE, ttl=USERS_CACHE_TTL)
+reports_cache = TTLCache("reports", maxsize=REPORTS_CACHE_SIZE, ttl=REPORTS_CACHE_TTL)
+# Растёт при каждой инвалидации: результат чтения, начатого до записи, не кладём в кэш
+generation = 0
+# Последний известный username каждого автора с отчётами: новый или переименованный сбрасывает страницы
+known_usernames: dict = {}
+
+# Keyset-пагинация по индексу bot_users (lower(username) COLLATE "C", user_id).
+# Первая страница и страница от курсора — разные запросы: условие вида «$3 IS NULL OR ...»
+# в общем (generic) плане подготовленного запроса становится фильтром, и каждая страница
+# заново читала бы индекс с начала префикса. $1/$2 — границы префикса
+USERS_FIRST_QUERY = """
+    SELECT u.user_id, u.username
+    FROM bot_users u
+    WHERE u.username IS NOT NULL
+      AND lower(u.username) COLLATE "C" >= $1 AND lower(u.username) COLLATE "C" < $2
+      AND EXISTS (SELECT 1 FROM reports r WHERE r.user_id = u.user_id)
+    ORDER BY lower(u.username) COLLATE "C", u.user_id
+    LIMIT $3
+"""
+# $3 — user_id, от которого листаем: его строка — граница диапазона в индексе, $4 — лимит
+USERS_CURSOR_QUERY = """
+    SELECT u.user_id, u.username
+    FROM bot_users u
+    WHERE u.username IS NOT NULL
+      AND lower(u.username) COLLATE "C" >= $1 AND lower(u.username) COLLATE "C" < $2
+      AND (lower(u.username) COLLATE "C", u.user_id) {op}
+          (SELECT lower(username) COLLATE "C", user_id FROM bot_users WHERE user_id = $3)
+      AND EXISTS (SELECT 1 FROM reports r WHERE r.user_id = u.user_id)
+    ORDER BY lower(u.username) COLLATE "C" {order}, u.user_id {order}
+    LIMIT $4
+"""
+USERS_NEXT_QUERY = USERS_CURSOR_QUERY.format(op=">", order="ASC")
+USERS_PREV_QUERY = USERS_CURSOR_QUERY.format(op="<", order="DESC")
+
+
+# 📌 Чтение через кэш
+async def get_users_page(prefix: str, cursor: int | None, backward: bool, limit: int):
+    """Возвращает (список (user_id, username), есть ли ещё записи в направлении листания)."""
+    key = (prefix, cursor, backward, limit)
+    page = users_cache.get(key)
+    if page is MISSING:
+        started = generation
+        # Username'ы в Telegram — только [a-z0-9_], "~" больше любого из этих символов
+        if cursor is None:
+            rows = await db.fetch(USERS_FIRST_QUERY, prefix, prefix + "~", limit + 1)
+        else:
+            query = USERS_PREV_QUERY if backward else USERS_NEXT_QUERY
+            rows = await db.fetch(query, prefix, prefix + "~", cursor, limit + 1)
+        users = [(row["user_id"], row["username"]) for row in rows[:limit]]
+        if backward:
+            users.reverse()
+        page = (users, len(rows) > limit)
+        if started == generation:
+            users_cache.set(key, page)
+    return page
+
+
+async def get_report(user_id, day):
+    """Возвращает (username, текст отчёта или None); отсутствие отчёта тоже кэшируется."""
+    report = reports_cache.get((user_id, day))
+    if report is MISSING:
+        started = generation
+        row = await db.fetchrow("""
+            SELECT u.username, r.text
+            FROM bot_users u
+            LEFT JOIN reports r ON r.user_id = u.user_id AND r.date = $2
+            WHERE u.user_id = $1
+        """, user_id, day)
+        report = (row["username"], row["text"]) if row else (None, None)
+        if started == generation:
+            reports_cache.set((user_id, day), report)
+    return report
+
+
+# 📌 Инвалидация при записи отчёта: при постановке в очередь и ещё раз после записи в БД
+def invalidate_report(user_id, day):
+    global generation
+    generation += 1
+    reports_cache.invalidate((user_id, day))
+
+
+# Список авторов для /get меняется, только когда запись уже в БД: первый отчёт нового
+# (или переименованного) автора или удаление, после которого отчётов могло не остаться.
+# writes — [(user_id, username, action)] записанной пачки
+def invalidate_authors(writes):
+    global generation
+    changed = False
+    for user_id, username, action in writes:
+        if action == "delete":
+            known_usernames.pop(user_id, None)
+            changed = True
+        elif known_usernames.get(user_id) != username:
+            known_usernames[user_id] = username
+            changed = True
+    if changed:
+        generation += 1
+        users_cache.clear()
+
+
+def stats() -> dict:
+    return {"users": users_cache.stats(), "reports": reports_cache.stats()}
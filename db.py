@@ -0,0 +1,415 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from metrics import track_query
+
+# Параметры пула соединений (можно переопределить через переменные окружения)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Несколько процессов бота с одной БД (WEB_CONCURRENCY>1 у uvicorn). Апдейты одного пользователя
+# тогда попадают в разные процессы, поэтому локальные кэши FSM и отчётов и отложенная запись
+# по умолчанию выключаются — каждое чтение и запись идут в БД (см. fsm_storage, cache, report_writer)
+MULTI_PROCESS = int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+
+# Общий пул на весь процесс — создаётся в main(), закрывается в on_shutdown()
+pool: asyncpg.Pool | None = None
+
+
+async def init_pool(dsn: str) -> asyncpg.Pool:
+    global pool
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            dsn,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+        )
+        logging.info(f"🗄 Пул БД создан (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return pool
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+        logging.info("🗄 Пул БД закрыт")
+
+
+def get_pool() -> asyncpg.Pool:
+    if pool is None:
+        raise RuntimeError("Пул БД не инициализирован, сначала вызови init_pool()")
+    return pool
+
+
+# 📌 Каждая функция берёт соединение из пула ровно на одну операцию.
+# Время запроса (вместе с ожиданием соединения) пишется в метрики по имени запроса
+async def fetch(query, *args):
+    async with track_query(query), get_pool().acquire() as conn:
+        return await conn.fetch(query, *args)
+
+
+async def fetchrow(query, *args):
+    async with track_query(query), get_pool().acquire() as conn:
+        return await conn.fetchrow(query, *args)
+
+
+async def fetchval(query, *args):
+    async with track_query(query), get_pool().acquire() as conn:
+        return await conn.fetchval(query, *args)
+
+
+async def execute(query, *args):
+    async with track_query(query), get_pool().acquire() as conn:
+        return await conn.execute(query, *args)
+
+
+async def executemany(query, args):
+    async with track_query(query), get_pool().acquire() as conn:
+        return await conn.executemany(query, args)
+
+
+# Несколько запросов на одном соединении в одной транзакции
+@asynccontextmanager
+async def transaction():
+    async with track_query("transaction"), get_pool().acquire() as conn:
+        async with conn.transaction():
+            yield conn
+
+
+# Блокировка на время задачи: при нескольких процессах её выполняет только один
+@asynccontextmanager
+async def try_advisory_lock(lock_id: int):
+    async with get_pool().acquire() as conn:
+        locked = await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_id)
+        try:
+            yield locked
+        finally:
+            if locked:
+                await conn.execute("SELECT pg_advisory_unlock($1)", lock_id)
+
+
+# 📌 Версионированные миграции схемы: (версия, SQL). Новые миграции — только в конец списка
+MIGRATIONS = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS reports (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            username TEXT,
+            text TEXT,
+            date TEXT
+        )
+    """),
+    # date -> DATE, один отчёт на пользователя в день, индекс для выборки по username
+    (2, """
+        UPDATE reports r SET text = d.text
+        FROM (
+            SELECT min(id) AS id, string_agg(text, E'\\n' ORDER BY id) AS text
+            FROM reports
+            GROUP BY user_id, date
+            HAVING count(*) > 1
+        ) d
+        WHERE r.id = d.id;
+
+        DELETE FROM reports r
+        USING reports k
+        WHERE r.user_id = k.user_id AND r.date = k.date AND r.id > k.id;
+
+        ALTER TABLE reports ALTER COLUMN date TYPE DATE USING date::date;
+        ALTER TABLE reports ADD CONSTRAINT reports_user_id_date_key UNIQUE (user_id, date);
+        CREATE INDEX IF NOT EXISTS reports_username_date_idx ON reports (username, date);
+    """),
+    # Получатели напоминаний и журнал доставки
+    (3, """
+        CREATE TABLE IF NOT EXISTS bot_users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        INSERT INTO bot_users (user_id, username)
+        SELECT DISTINCT ON (user_id) user_id, username
+        FROM reports
+        WHERE user_id IS NOT NULL
+        ORDER BY user_id, date DESC
+        ON CONFLICT (user_id) DO NOTHING;
+
+        CREATE TABLE IF NOT EXISTS reminder_deliveries (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS reminder_deliveries_created_at_idx ON reminder_deliveries (created_at);
+    """),
+    # Состояния FSM (UNLOGGED: без WAL, данные временные)
+    (4, """
+        CREATE UNLOGGED TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}'::jsonb,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """),
+    # Keyset-пагинация и поиск по префиксу username в /get
+    (5, """
+        CREATE INDEX IF NOT EXISTS bot_users_username_idx
+        ON bot_users ((lower(username) COLLATE "C"), user_id)
+        WHERE username IS NOT NULL;
+    """),
+    # Диапазонные выборки по дате для /export и дайджеста
+    (6, """
+        CREATE INDEX IF NOT EXISTS reports_date_idx ON reports (date);
+    """),
+    # Персональные напоминания: время, часовой пояс, дни недели (бит 0 — понедельник), «отложить».
+    # next_fire_at — когда напоминание сработает в следующий раз (считает reminders.py);
+    # NULL в remind_at/timezone — значения по умолчанию из настроек бота
+    (7, """
+        CREATE TABLE IF NOT EXISTS reminder_settings (
+            user_id BIGINT PRIMARY KEY REFERENCES bot_users (user_id) ON DELETE CASCADE,
+            enabled BOOLEAN NOT NULL DEFAULT TRUE,
+            remind_at TIME,
+            timezone TEXT,
+            weekdays SMALLINT NOT NULL DEFAULT 127,
+            snoozed_until TIMESTAMPTZ,
+            next_fire_at TIMESTAMPTZ,
+            last_sent_at TIMESTAMPTZ
+        );
+        CREATE INDEX IF NOT EXISTS reminder_settings_next_fire_at_idx
+        ON reminder_settings (next_fire_at) WHERE enabled;
+        CREATE INDEX IF NOT EXISTS reminder_settings_unscheduled_idx
+        ON reminder_settings (user_id) WHERE enabled AND next_fire_at IS NULL;
+
+        INSERT INTO reminder_settings (user_id)
+        SELECT user_id FROM bot_users
+        ON CONFLICT (user_id) DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION create_reminder_settings() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO reminder_settings (user_id) VALUES (NEW.user_id) ON CONFLICT (user_id) DO NOTHING;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS bot_users_reminder_settings ON bot_users;
+        CREATE TRIGGER bot_users_reminder_settings AFTER INSERT ON bot_users
+        FOR EACH ROW EXECUTE FUNCTION create_reminder_settings();
+    """),
+    # Статистика для /stats, поддерживается триггером на reports при каждой записи:
+    # report_stats — по пользователю (серии, число дней, суммарная длина),
+    # report_daily_stats — по дням (сколько отчётов сдано)
+    (8, """
+        CREATE TABLE IF NOT EXISTS report_stats (
+            user_id BIGINT PRIMARY KEY,
+            first_date DATE NOT NULL,
+            last_date DATE NOT NULL,
+            days INT NOT NULL,
+            total_length BIGINT NOT NULL,
+            current_streak INT NOT NULL,
+            longest_streak INT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS report_daily_stats (
+            date DATE PRIMARY KEY,
+            reports INT NOT NULL,
+            total_length BIGINT NOT NULL
+        );
+
+        -- Полный пересчёт одного пользователя: острова подряд идущих дат (date - row_number)
+        CREATE OR REPLACE FUNCTION recompute_report_stats(uid BIGINT) RETURNS void AS $$
+        BEGIN
+            DELETE FROM report_stats WHERE user_id = uid;
+            INSERT INTO report_stats
+            SELECT uid, min(first_date), max(last_date), sum(days), sum(total_length),
+                   (array_agg(days ORDER BY last_date DESC))[1], max(days)
+            FROM (
+                SELECT min(date) AS first_date, max(date) AS last_date, count(*) AS days,
+                       sum(length(coalesce(text, ''))) AS total_length
+                FROM (
+                    SELECT date, text, date - (row_number() OVER (ORDER BY date))::int AS island
+                    FROM reports WHERE user_id = uid
+                ) d
+                GROUP BY island
+            ) islands
+            HAVING count(*) > 0;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Отчёты пишутся за сегодня, поэтому обычно хватает инкремента;
+        -- запись задним числом, удаление и перенос пересчитывают одного пользователя
+        CREATE OR REPLACE FUNCTION update_report_stats() RETURNS trigger AS $$
+        DECLARE
+            new_length BIGINT;
+            old_length BIGINT;
+            stats report_stats%ROWTYPE;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                new_length := length(coalesce(NEW.text, ''));
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                old_length := length(coalesce(OLD.text, ''));
+            END IF;
+
+            IF TG_OP = 'UPDATE' AND NEW.user_id IS NOT DISTINCT FROM OLD.user_id AND NEW.date = OLD.date THEN
+                UPDATE report_stats SET total_length = total_length + new_length - old_length
+                WHERE user_id = NEW.user_id;
+                UPDATE report_daily_stats SET total_length = total_length + new_length - old_length
+                WHERE date = NEW.date;
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE report_daily_stats SET reports = reports - 1, total_length = total_length - old_length
+                WHERE date = OLD.date;
+                IF OLD.user_id IS NOT NULL THEN
+                    PERFORM recompute_report_stats(OLD.user_id);
+                END IF;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO report_daily_stats (date, reports, total_length) VALUES (NEW.date, 1, new_length)
+                ON CONFLICT (date) DO UPDATE
+                SET reports = report_daily_stats.reports + 1,
+                    total_length = report_daily_stats.total_length + EXCLUDED.total_length;
+                IF NEW.user_id IS NULL THEN
+                    RETURN NULL;
+                END IF;
+
+                INSERT INTO report_stats VALUES (NEW.user_id, NEW.date, NEW.date, 1, new_length, 1, 1)
+                ON CONFLICT (user_id) DO NOTHING;
+                IF FOUND THEN
+                    RETURN NULL;
+                END IF;
+                SELECT * INTO stats FROM report_stats WHERE user_id = NEW.user_id FOR UPDATE;
+                IF NEW.date > stats.last_date THEN
+                    stats.current_streak := CASE WHEN NEW.date = stats.last_date + 1
+                                                 THEN stats.current_streak + 1 ELSE 1 END;
+                    UPDATE report_stats
+                    SET last_date = NEW.date, days = days + 1, total_length = total_length + new_length,
+                        current_streak = stats.current_streak,
+                        longest_streak = greatest(longest_streak, stats.current_streak)
+                    WHERE user_id = NEW.user_id;
+                ELSE
+                    PERFORM recompute_report_stats(NEW.user_id);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS reports_stats ON reports;
+        CREATE TRIGGER reports_stats AFTER INSERT OR UPDATE OR DELETE ON reports
+        FOR EACH ROW EXECUTE FUNCTION update_report_stats();
+
+        INSERT INTO report_daily_stats (date, reports, total_length)
+        SELECT date, count(*), sum(length(coalesce(text, ''))) FROM reports GROUP BY date
+        ON CONFLICT (date) DO NOTHING;
+
+        SELECT recompute_report_stats(user_id) FROM (SELECT DISTINCT user_id FROM reports WHERE user_id IS NOT NULL) u;
+    """),
+    # Полнотекстовый поиск по отчётам (/search и inline-режим)
+    (9, """
+        ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('russian', coalesce(text, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS reports_search_vector_idx ON reports USING GIN (search_vector);
+    """),
+    # Отметка об отправленном дайджесте: за одну неделю — одна отправка на все процессы
+    (10, """
+        CREATE TABLE IF NOT EXISTS digest_runs (
+            week_start DATE PRIMARY KEY,
+            sent_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """),
+    # Обработанные апдейты: повторная доставка после перезапуска не обрабатывается дважды
+    (11, """
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id BIGINT PRIMARY KEY,
+            processed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS processed_updates_processed_at_idx ON processed_updates (processed_at);
+    """),
+]
+
+# Ключ advisory-лока, чтобы несколько процессов не мигрировали одновременно
+MIGRATION_LOCK_ID = 7_219_129_815
+
+
+async def migrate():
+    async with transaction() as conn:
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_ID)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        current = await conn.fetchval("SELECT coalesce(max(version), 0) FROM schema_version")
+        for version, query in MIGRATIONS:
+            if version <= current:
+                continue
+            logging.info(f"🗄 Применяем миграцию схемы v{version}")
+            await conn.execute(query)
+            await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", version)
+
+
+# 📌 Регистрируем пользователя как получателя напоминаний (и снова включаем, если он был заблокирован)
+UPSERT_USER = """
+    INSERT INTO bot_users (user_id, username) VALUES ($1, $2)
+    ON CONFLICT (user_id) DO UPDATE
+    SET username = EXCLUDED.username, is_active = TRUE, updated_at = now()
+"""
+
+
+async def register_user(user_id, username):
+    return await execute(UPSERT_USER, user_id, username)
+
+
+# 📌 user_id по username (без учёта регистра) для /stats, /export и /search.
+# Выражение совпадает с индексом bot_users_username_idx; при одинаковых никах — кто обновлялся последним
+FIND_USER_ID = """
+    SELECT user_id FROM bot_users
+    WHERE lower(username) COLLATE "C" = lower($1) COLLATE "C"
+    ORDER BY updated_at DESC
+    LIMIT 1
+"""
+
+
+async def find_user_id(username: str):
+    return await fetchval(FIND_USER_ID, username)
+
+
+# 📌 Запись отчёта одним запросом: дописать к существующему или заменить его.
+# Заодно регистрируем автора в bot_users (CTE, без лишнего round trip)
+UPSERT_REPORT_APPEND = """
+    WITH u AS (
+        INSERT INTO bot_users (user_id, username) VALUES ($1, $2)
+        ON CONFLICT (user_id) DO UPDATE
+        SET username = EXCLUDED.username, is_active = TRUE, updated_at = now()
+    )
+    INSERT INTO reports (user_id, username, text, date) VALUES ($1, $2, $3, $4)
+    ON CONFLICT (user_id, date) DO UPDATE
+    SET text = reports.text || E'\\n' || EXCLUDED.text, username = EXCLUDED.username
+"""
+
+UPSERT_REPORT_REPLACE = """
+    WITH u AS (
+        INSERT INTO bot_users (user_id, username) VALUES ($1, $2)
+        ON CONFLICT (user_id) DO UPDATE
+        SET username = EXCLUDED.username, is_active = TRUE, updated_at = now()
+    )
+    INSERT INTO reports (user_id, username, text, date) VALUES ($1, $2, $3, $4)
+    ON CONFLICT (user_id, date) DO UPDATE
+    SET text = EXCLUDED.text, username = EXCLUDED.username
+"""
+
+
+async def upsert_report(user_id, username, text, day, append=False):
+    query = UPSERT_REPORT_APPEND if append else UPSERT_REPORT_REPLACE
+    return await execute(query, user_id, username, text, day)
@@ -0,0 +1,142 @@
+import os
+import csv
+import logging
+import tempfile
+from datetime import date, timedelta
+
+from aiogram import Bot
+from aiogram.types import FSInputFile
+
+import db
+
+# Куда отправлять еженедельный дайджест (чат руководителей); пусто — не отправлять
+DIGEST_CHAT_ID = os.getenv("DIGEST_CHAT_ID")
+EXPORT_PREFETCH = 500
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+EXPORT_QUERY = """
+    SELECT date, user_id, username, text
+    FROM reports
+    WHERE ($1::date IS NULL OR date >= $1) AND ($2::date IS NULL OR date <= $2)
+      AND ($3::bigint IS NULL OR user_id = $3)
+    ORDER BY date, username, user_id
+"""
+
+# Один диапазонный запрос: итоги по пользователю приходят оконными функциями
+# вместе с первой строкой его отчётов, поэтому документ пишется за один проход.
+# Имя одно на пользователя (текущее из bot_users, иначе из последнего отчёта),
+# иначе после смены ника его отчёты разъехались бы по двум группам
+DIGEST_QUERY = """
+    SELECT user_id, name AS username, date, text, days, avg_length
+    FROM (
+        SELECT r.user_id, r.date, coalesce(r.text, '') AS text,
+               coalesce(u.username, first_value(r.username) OVER latest, r.user_id::text) AS name,
+               count(*) OVER w AS days,
+               avg(length(coalesce(r.text, ''))) OVER w AS avg_length
+        FROM reports r
+        LEFT JOIN bot_users u ON u.user_id = r.user_id
+        WHERE r.date BETWEEN $1 AND $2
+        WINDOW w AS (PARTITION BY r.user_id),
+               latest AS (PARTITION BY r.user_id ORDER BY r.date DESC)
+    ) d
+    ORDER BY lower(name), user_id, date
+"""
+
+
+async def stream_rows(query, *args):
+    # Серверный курсор: строки приходят пачками, в памяти только текущая пачка
+    async with db.transaction() as conn:
+        async for record in conn.cursor(query, *args, prefetch=EXPORT_PREFETCH):
+            yield record
+
+
+# 📌 CSV-выгрузка отчётов за период (границы можно не задавать) в файл, возвращает число строк
+async def write_export_csv(path, start: date | None, end: date | None, user_id=None) -> int:
+    rows = 0
+    # utf-8-sig, чтобы Excel сразу открыл кириллицу
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "user_id", "username", "text"])
+        async for record in stream_rows(EXPORT_QUERY, start, end, user_id):
+            writer.writerow([record["date"].isoformat(), record["user_id"], record["username"], record["text"]])
+            rows += 1
+    return rows
+
+
+# 📌 Текстовый дайджест за период: по каждому пользователю итоги и отчёты по дням
+async def write_digest(path, start: date, end: date) -> tuple[int, int]:
+    total_days = (end - start).days + 1
+    users = reports = 0
+    current_user = object()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"📊 Дайджест отчётов за {start:%d.%m}–{end:%d.%m.%Y}\n")
+        async for record in stream_rows(DIGEST_QUERY, start, end):
+            if record["user_id"] != current_user:
+                current_user = record["user_id"]
+                users += 1
+                f.write(
+                    f"\n@{record['username']} — {record['days']} из {total_days} дн., "
+                    f"в среднем {round(record['avg_length'])} симв.\n"
+                )
+            day = record["date"]
+            text = record["text"].replace("\n", "\n      ")
+            f.write(f"  {day:%d.%m} ({WEEKDAYS[day.weekday()]}): {text}\n")
+            reports += 1
+        if not reports:
+            f.write("\nЗа этот период отчётов нет.\n")
+    return users, reports
+
+
+def describe_period(start: date | None, end: date | None) -> str:
+    if start is None and end is None:
+        return "всё время"
+    return f"{start or '…'} – {end or '…'}"
+
+
+# Документ собирается во временном файле и отправляется с диска (FSInputFile),
+# поэтому память не растёт вместе с историей
+async def send_export(bot: Bot, chat_id: int, start: date | None, end: date | None, user_id=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"reports_{start or 'begin'}_{end or 'now'}.csv")
+        rows = await write_export_csv(path, start, end, user_id)
+        period = describe_period(start, end)
+        if not rows:
+            await bot.send_message(chat_id, f"❌ Нет отчётов за {period}.")
+            return
+        await bot.send_document(chat_id, FSInputFile(path), caption=f"📦 Отчёты за {period}: {rows} шт.")
+
+
+async def send_digest(bot: Bot, chat_id, start: date, end: date):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"digest_{start}_{end}.txt")
+        users, reports = await write_digest(path, start, end)
+        await bot.send_document(
+            chat_id, FSInputFile(path),
+            caption=f"📊 Дайджест за {start:%d.%m}–{end:%d.%m}: {users} польз., {reports} отчётов"
+        )
+
+
+def last_week(today: date) -> tuple[date, date]:
+    # Прошедшая неделя с понедельника по воскресенье
+    end = today - timedelta(days=today.weekday() + 1)
+    return end - timedelta(days=6), end
+
+
+# 📌 Еженедельный дайджест по расписанию. Задача срабатывает в каждом процессе, отправляет
+# тот, кто первым вставил отметку за неделю; при ошибке отметка снимается, чтобы повторить
+async def weekly_digest(bot: Bot, today: date):
+    if not DIGEST_CHAT_ID:
+        return
+    start, end = last_week(today)
+    claimed = await db.fetchval(
+        "INSERT INTO digest_runs (week_start) VALUES ($1) ON CONFLICT DO NOTHING RETURNING week_start", start
+    )
+    if claimed is None:
+        logging.info(f"Дайджест за неделю с {start} уже отправлен")
+        return
+    try:
+        await send_digest(bot, int(DIGEST_CHAT_ID), start, end)
+    except Exception as e:
+        logging.error(f"Ошибка отправки дайджеста: {e}")
+        await db.execute("DELETE FROM digest_runs WHERE week_start = $1", start)
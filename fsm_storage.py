@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import db
+from lifecycle import supervise
+
+# Сколько секунд запись живёт в локальном кэше и как часто сбрасываем изменения в БД.
+# 0 — без кэша и со сквозной записью (по умолчанию при нескольких процессах)
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0" if db.MULTI_PROCESS else "600"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0" if db.MULTI_PROCESS else "1"))
+
+UPSERT_FSM = """
+    INSERT INTO fsm_storage (key, state, data, updated_at) VALUES ($1, $2, $3::jsonb, now())
+    ON CONFLICT (key) DO UPDATE
+    SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = now()
+"""
+
+
+@dataclass
+class CacheEntry:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    expires_at: float = 0.0
+    dirty: bool = False
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в UNLOGGED-таблице fsm_storage с локальным write-back кэшем.
+
+    Чтение состояния из кэша не ходит в сеть; изменения копятся в памяти и
+    пачкой сбрасываются в БД фоновой задачей раз в ``flush_interval`` секунд
+    (и при закрытии). Запись, к которой не обращались ``ttl`` секунд, вытесняется
+    из кэша и при следующем обращении перечитывается из БД.
+
+    Если апдейты одного пользователя попадают в разные процессы, кэш даст устаревшее
+    состояние, поэтому там нужны ``ttl=0`` (каждое чтение из БД) и ``flush_interval=0``
+    (изменение записывается в БД до ответа обработчика).
+    """
+
+    def __init__(
+        self,
+        ttl: float = FSM_CACHE_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        key_builder: Optional[KeyBuilder] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache: Dict[str, CacheEntry] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+
+    async def _entry(self, key: StorageKey) -> CacheEntry:
+        name = self.key_builder.build(key)
+        entry = self.cache.get(name)
+        now = time.monotonic()
+        if entry is None or (not entry.dirty and entry.expires_at < now):
+            row = await db.fetchrow("SELECT state, data::text AS data FROM fsm_storage WHERE key = $1", name)
+            fresh = self.cache.get(name)
+            if fresh is not None and fresh is not entry:
+                # Пока ждали БД, запись уже создали в другом обработчике — она новее
+                entry = fresh
+            else:
+                entry = CacheEntry()
+                if row:
+                    entry.state = row["state"]
+                    entry.data = json.loads(row["data"]) if row["data"] else {}
+                self.cache[name] = entry
+        entry.expires_at = now + self.ttl
+        return entry
+
+    async def _mark_dirty(self, entry: CacheEntry):
+        entry.dirty = True
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None or self._flusher.done():
+            # Упавший цикл перезапускается с растущей паузой (см. lifecycle.supervise)
+            self._flusher = asyncio.create_task(supervise("fsm_flush", self._flush_loop))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        await self._mark_dirty(entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def _flush_loop(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка сохранения FSM в БД: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            now = time.monotonic()
+            upserts, deletes = [], []
+            for name, entry in list(self.cache.items()):
+                if entry.dirty:
+                    entry.dirty = False
+                    if entry.state is None and not entry.data:
+                        deletes.append(name)
+                    else:
+                        upserts.append((name, entry.state, json.dumps(entry.data, ensure_ascii=False)))
+                elif entry.expires_at < now:
+                    del self.cache[name]
+            if not upserts and not deletes:
+                return
+            try:
+                async with db.transaction() as conn:
+                    if upserts:
+                        await conn.executemany(UPSERT_FSM, upserts)
+                    if deletes:
+                        await conn.execute("DELETE FROM fsm_storage WHERE key = ANY($1::text[])", deletes)
+            except BaseException:
+                # Не потеряли изменения (в том числе при отмене посреди записи) — попробуем ещё раз
+                for name, *_ in upserts:
+                    if name in self.cache:
+                        self.cache[name].dirty = True
+                for name in deletes:
+                    if name in self.cache:
+                        self.cache[name].dirty = True
+                raise
+
+    async def close(self) -> None:
+        # Фоновый сброс останавливаем между записями и дожидаемся, затем сбрасываем остаток
+        self._stop.set()
+        if self._flusher is not None:
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        self._stop.clear()
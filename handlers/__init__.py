@@ -0,0 +1,5 @@
+from handlers import onboarding, reporting, viewing, exporting, reminding, stats, searching
+
+# Порядок важен: команды и кнопки меню должны срабатывать раньше,
+# чем ожидание текста отчёта в reporting
+routers = [onboarding.router, viewing.router, exporting.router, stats.router, searching.router, reminding.router, reporting.router]
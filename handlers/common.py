@@ -0,0 +1,66 @@
+import os
+from datetime import datetime
+
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State, StatesGroup
+
+# 📌 Главное меню кнопок
+# Меню для ЛС (inline-кнопки)
+menu_keyboard_private = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📢 Сообщить отчёт", callback_data="report")],
+    [InlineKeyboardButton(text="📊 Запросить отчёт", callback_data="get")],
+    [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")]
+])
+
+# Меню для групп (обычные кнопки)
+menu_keyboard_group = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📢 Сообщить отчёт"), KeyboardButton(text="📊 Запросить отчёт")],
+        [KeyboardButton(text="ℹ️ Помощь")]
+    ],
+    resize_keyboard=True
+)
+
+
+def menu_for(message: Message):
+    return menu_keyboard_private if message.chat.type == "private" else menu_keyboard_group
+
+
+class ReportState(StatesGroup):
+    waiting_for_confirmation = State()
+    waiting_for_report = State()
+
+
+# Сегодняшняя дата (колонка reports.date имеет тип DATE)
+def today():
+    return datetime.now().date()
+
+
+# 📌 Компактные callback_data для /get (версия в префиксе, вместо username — user_id)
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "10"))
+MAX_PREFIX_LENGTH = 20
+
+
+class UsersPage(CallbackData, prefix="up1"):
+    backward: bool
+    cursor: int
+    prefix: str | None = None
+
+
+class UserPick(CallbackData, prefix="us1"):
+    user_id: int
+    week: int = 0
+
+
+class DatePick(CallbackData, prefix="ud1"):
+    user_id: int
+    day: str  # YYYYMMDD
+
+
+# 📌 Страница результатов /search (сам запрос хранится в данных FSM — в callback_data он не влезет)
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "5"))
+
+
+class SearchPage(CallbackData, prefix="sr1"):
+    page: int
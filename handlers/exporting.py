@@ -0,0 +1,54 @@
+import logging
+from datetime import datetime, timedelta
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+import db
+import exports
+from handlers.common import today
+
+router = Router(name="exporting")
+
+
+# 📌 /export [YYYY-MM-DD [YYYY-MM-DD]] [@username] — CSV с отчётами одним документом
+@router.message(Command("export"))
+async def export_command(message: Message, command: CommandObject):
+    dates, username = [], None
+    for arg in (command.args or "").split():
+        if arg.startswith("@"):
+            username = arg[1:]
+            continue
+        try:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d").date())
+        except ValueError:
+            await message.answer("⚠️ Формат: /export [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [@username]")
+            return
+    start = dates[0] if dates else None
+    end = dates[1] if len(dates) > 1 else None
+
+    user_id = None
+    if username:
+        user_id = await db.find_user_id(username)
+        if user_id is None:
+            await message.answer(f"❌ Пользователь @{username} не найден.")
+            return
+
+    await message.answer("⏳ Готовлю выгрузку...")
+    try:
+        await exports.send_export(message.bot, message.chat.id, start, end, user_id)
+    except Exception as e:
+        logging.error(f"Ошибка выгрузки: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
+
+
+# 📌 /digest — дайджест за последние 7 дней
+@router.message(Command("digest"))
+async def digest_command(message: Message):
+    end = today()
+    try:
+        await exports.send_digest(message.bot, message.chat.id, end - timedelta(days=6), end)
+    except Exception as e:
+        logging.error(f"Ошибка дайджеста: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
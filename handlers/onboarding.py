@@ -0,0 +1,52 @@
+import logging
+
+from aiogram import Bot, Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
+
+import db
+from handlers.common import menu_for, menu_keyboard_group
+
+router = Router(name="onboarding")
+# Колбэки этого роутера — только кнопка помощи; остальные сразу уходят дальше
+router.callback_query.filter(F.data == "help")
+
+
+# 📌 Команда /start
+@router.message(Command("start"))
+async def start_command(message: Message):
+    if message.from_user:
+        await db.register_user(message.from_user.id, message.from_user.username)
+    await message.answer("Привет! Я буду спрашивать тебя каждый день, что ты делал.\n\nВыбери команду ниже:", reply_markup=menu_for(message))
+
+
+# 📌 Команда /help
+@router.message(Command("help"))
+@router.message(F.text == "ℹ️ Помощь")
+async def help_command(message: Message):
+    await message.answer("📌 Доступные команды:\n"
+                         "/report – Записать отчёт о дне\n"
+                         "/get – Запросить отчёт (выбор кнопками)\n"
+                         "/export – Выгрузить отчёты в CSV (можно указать даты и @username)\n"
+                         "/digest – Дайджест отчётов за неделю\n"
+                         "/search – Поиск по тексту отчётов (можно @username и даты)\n"
+                         "/stats – Статистика: серии, пропуски, средняя длина (можно @username)\n"
+                         "/remind – Время, часовой пояс и дни напоминаний\n"
+                         "/start – Перезапустить бота", reply_markup=menu_for(message))
+
+
+@router.callback_query(F.data == "help")
+async def help_callback(callback: CallbackQuery):
+    await callback.answer()
+    await help_command(callback.message)
+
+
+@router.chat_member()
+async def bot_added_to_group(event: ChatMemberUpdated, bot: Bot):
+    if event.new_chat_member and event.new_chat_member.user.id == bot.id:
+        logging.info(f"Бот добавлен в группу: {event.chat.id}")
+        await bot.send_message(
+            event.chat.id,
+            "Привет! Теперь ты можешь отправлять отчёты прямо из группы. Выбери команду ниже:",
+            reply_markup=menu_keyboard_group  # 💡 Исправил!
+        )
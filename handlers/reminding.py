@@ -0,0 +1,122 @@
+import logging
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+import db
+import reminders
+
+router = Router(name="reminding")
+
+WEEKDAY_NAMES = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+WEEKDAY_PRESETS = {"все": 0b1111111, "будни": 0b0011111, "выходные": 0b1100000}
+
+REMIND_USAGE = (
+    "⏰ Настройка напоминаний:\n"
+    "/remind 19:30 – время напоминания\n"
+    "/remind tz Europe/Moscow – часовой пояс\n"
+    "/remind days пн-пт (или будни, все, 1,3,5) – дни недели\n"
+    "/remind snooze 3 – отложить на 3 часа (0 – отменить)\n"
+    "/remind off / on – выключить / включить"
+)
+
+
+# 📌 "пн-пт", "1,3,5", "будни" -> битовая маска дней недели (бит 0 — понедельник)
+def parse_weekdays(value: str) -> int | None:
+    value = value.lower()
+    if value in WEEKDAY_PRESETS:
+        return WEEKDAY_PRESETS[value]
+    mask = 0
+    for part in value.split(","):
+        bounds = part.split("-")
+        if len(bounds) > 2:
+            return None
+        days = []
+        for bound in bounds:
+            bound = bound.strip()
+            if bound in WEEKDAY_NAMES:
+                days.append(WEEKDAY_NAMES.index(bound))
+            elif bound.isdigit() and 1 <= int(bound) <= 7:
+                days.append(int(bound) - 1)
+            else:
+                return None
+        for day in range(days[0], days[-1] + 1):
+            mask |= 1 << day
+    return mask or None
+
+
+def describe_weekdays(mask: int) -> str:
+    for name, preset in WEEKDAY_PRESETS.items():
+        if mask == preset:
+            return name
+    return ", ".join(name for i, name in enumerate(WEEKDAY_NAMES) if mask & (1 << i)) or "никогда"
+
+
+def describe_settings(settings) -> str:
+    zone = ZoneInfo(settings["timezone"] or reminders.DEFAULT_TIMEZONE)
+    remind_at = settings["remind_at"] or reminders.DEFAULT_REMIND_AT
+    lines = [
+        f"⏰ Напоминания {'включены' if settings['enabled'] else 'выключены'}",
+        f"Время: {remind_at:%H:%M} ({zone.key})",
+        f"Дни: {describe_weekdays(settings['weekdays'])}",
+    ]
+    now = datetime.now(timezone.utc)
+    if settings["snoozed_until"] and settings["snoozed_until"] > now:
+        lines.append(f"Отложено до {settings['snoozed_until'].astimezone(zone):%d.%m %H:%M}")
+    if settings["next_fire_at"]:
+        lines.append(f"Следующее: {settings['next_fire_at'].astimezone(zone):%d.%m %H:%M}")
+    return "\n".join(lines)
+
+
+def parse_changes(args: list[str]) -> dict | None:
+    action, value = args[0].lower(), args[1] if len(args) > 1 else None
+    if action in ("on", "off"):
+        return {"enabled": action == "on"}
+    if action == "tz" and value:
+        try:
+            return {"timezone": ZoneInfo(value).key}
+        except (ZoneInfoNotFoundError, ValueError):
+            return None
+    if action == "days" and value:
+        mask = parse_weekdays("".join(args[1:]))
+        return {"weekdays": mask} if mask else None
+    if action == "snooze" and value:
+        try:
+            hours = float(value.replace(",", "."))
+        except ValueError:
+            return None
+        if not 0 <= hours <= 24 * 30:
+            return None
+        return {"snoozed_until": datetime.now(timezone.utc) + timedelta(hours=hours) if hours else None}
+    try:
+        return {"remind_at": time.fromisoformat(action.zfill(5))}
+    except ValueError:
+        return None
+
+
+# 📌 /remind — показать или изменить настройки напоминаний
+@router.message(Command("remind"))
+async def remind_command(message: Message, command: CommandObject):
+    if not message.from_user:
+        return
+    user_id = message.from_user.id
+    try:
+        await db.register_user(user_id, message.from_user.username)
+        args = (command.args or "").split()
+        if not args:
+            settings = await reminders.get_settings(user_id)
+            await message.answer(describe_settings(settings) + "\n\n" + REMIND_USAGE)
+            return
+
+        changes = parse_changes(args)
+        if changes is None:
+            await message.answer("⚠️ Не понял настройку.\n\n" + REMIND_USAGE)
+            return
+        settings = await reminders.update_settings(user_id, **changes)
+        await message.answer("✅ Сохранено.\n" + describe_settings(settings))
+    except Exception as e:
+        logging.error(f"Ошибка настройки напоминаний: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
@@ -0,0 +1,124 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from report_writer import writer
+from handlers.common import ReportState, menu_for, today
+
+router = Router(name="reporting")
+# Колбэки этого роутера — фиксированный набор строк, проверка одним поиском в множестве
+REPORT_CALLBACKS = {"report", "confirm_report", "cancel_report", "edit_report", "edit_existing_report", "add_to_report"}
+router.callback_query.filter(F.data.in_(REPORT_CALLBACKS))
+
+
+# 📌 Команда /report (или кнопка "📢 Сообщить отчёт")
+@router.message(Command("report"))
+@router.message(F.text == "📢 Сообщить отчёт")
+async def report_command(message: Message, state: FSMContext):
+    await message.answer("✏️ Напиши, что ты сегодня делал...", reply_markup=menu_for(message))
+    await state.set_state(ReportState.waiting_for_report)
+
+
+@router.callback_query(F.data == "report")
+async def report_callback(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()  # Чтобы убрать "часики" загрузки
+    await report_command(callback.message, state)
+
+
+@router.message(ReportState.waiting_for_report, F.text)
+async def handle_report_text(message: Message, state: FSMContext):
+    user_data = await state.get_data()
+    append_mode = user_data.get("append_mode", False)
+
+    if append_mode:
+        # Запись уходит в очередь (см. report_writer.py), пользователю отвечаем сразу
+        await writer.append(message.from_user.id, message.from_user.username, message.text.strip(), today())
+
+        await message.answer("✅ Твой отчёт дополнен!", reply_markup=menu_for(message))
+        await state.clear()
+        return
+
+    # Через кэш отчётов и с учётом ещё не записанных изменений
+    existing_report = await writer.current_text(message.from_user.id, today())
+
+    # 🟢 Клавиатура выбора действия (изменить, добавить, отмена)
+    edit_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✏️ Изменить отчёт", callback_data="edit_existing_report")],
+        [InlineKeyboardButton(text="➕ Добавить к отчёту", callback_data="add_to_report")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_report")]
+    ])
+
+    if existing_report:
+        await message.answer("⚠️ У тебя уже есть отчёт за сегодня. Что ты хочешь сделать?", reply_markup=edit_keyboard)
+        return
+
+    # 🟢 Создаём новый отчёт
+    text = message.text.strip()
+    await state.update_data(report_text=text, append_mode=False)
+
+    confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_report")],
+        [InlineKeyboardButton(text="✏️ Редактировать", callback_data="edit_report")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_report")]
+    ])
+
+    await message.answer(f"📄 Твой отчёт:\n\n{text}\n\nТы подтверждаешь?", reply_markup=confirm_keyboard)
+    await state.set_state(ReportState.waiting_for_confirmation)
+
+
+@router.callback_query(F.data == "confirm_report")
+async def confirm_report(callback: CallbackQuery, state: FSMContext):
+    user_data = await state.get_data()
+    new_text = user_data.get("report_text")
+    append_mode = user_data.get("append_mode", False)
+    if not new_text:
+        # Повторное нажатие или кнопка из старого сообщения: состояние уже сброшено
+        await callback.answer("⌛ Эта кнопка устарела, отправь отчёт заново: /report", show_alert=True)
+        return
+
+    # Дописать или заменить отчёт за сегодня — в фоне, пачкой с другими
+    write = writer.append if append_mode else writer.replace
+    await write(callback.from_user.id, callback.from_user.username, new_text, today())
+
+    await callback.message.answer("✅ Отчёт записан!", reply_markup=menu_for(callback.message))
+    await state.clear()
+    await callback.answer()
+
+
+@router.callback_query(F.data == "cancel_report")
+async def cancel_report(callback: CallbackQuery, state: FSMContext):
+    await state.clear()  # 🟢 Сбрасываем состояние
+    await callback.message.answer("🚫 Действие отменено.", reply_markup=menu_for(callback.message))
+    await callback.answer()
+
+
+@router.callback_query(F.data == "edit_report")
+async def edit_report(callback: CallbackQuery, state: FSMContext):
+    await callback.message.answer("✏️ Напиши новый отчёт:")
+    await state.clear()
+    await callback.answer()
+
+
+@router.callback_query(F.data == "edit_existing_report")
+async def edit_existing_report(callback: CallbackQuery, state: FSMContext):
+    await writer.delete(callback.from_user.id, callback.from_user.username, today())
+
+    await state.clear()  # Удаляем все состояния, чтобы не зависнуть в старых данных
+    await callback.message.answer("✏️ Напиши новый отчёт:")
+    await state.set_state(ReportState.waiting_for_confirmation)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "add_to_report")
+async def add_to_report(callback: CallbackQuery, state: FSMContext):
+    existing_report = await writer.current_text(callback.from_user.id, today())
+
+    if existing_report:
+        await state.update_data(report_text=existing_report, append_mode=True)  # 🟢 Теперь без ошибки!
+        await callback.message.answer("✏️ Напиши, что хочешь добавить к отчёту:")
+        await state.set_state(ReportState.waiting_for_report)
+    else:
+        await callback.message.answer("⚠️ Ошибка: нет отчёта для дополнения.")
+
+    await callback.answer()
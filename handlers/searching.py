@@ -0,0 +1,125 @@
+import logging
+from datetime import date
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+    InlineKeyboardMarkup, InlineKeyboardButton,
+)
+
+import db
+import search
+from handlers.common import DatePick, SearchPage, SEARCH_PAGE_SIZE
+
+router = Router(name="searching")
+router.callback_query.filter(SearchPage.filter())
+
+SEARCH_USAGE = (
+    "🔎 Поиск по отчётам: /search <слова> [@username] [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]]\n"
+    "Фраза в кавычках ищется целиком, -слово исключает отчёты с ним.\n"
+    "В любом чате можно набрать @имя_бота <слова>."
+)
+INLINE_PAGE_SIZE = 20
+# Telegram ограничивает текст сообщения 4096 символами
+MESSAGE_LIMIT = 4096
+
+
+async def build_results_page(params: dict, page: int):
+    # В данных FSM даты лежат строками (хранилище сериализует их в JSON)
+    start, end = (date.fromisoformat(params[key]) if params.get(key) else None for key in ("start", "end"))
+    rows, has_more = await search.search_reports(
+        params["query"], params.get("user_id"), start, end,
+        limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE,
+    )
+    if not rows:
+        return (f"❌ По запросу «{params['query']}» ничего не найдено." if page == 0 else "Больше результатов нет."), None
+
+    lines = [f"🔎 «{params['query']}», стр. {page + 1}:"]
+    buttons = []
+    for row in rows:
+        lines.append(f"\n@{row['username']} за {row['date']:%d.%m.%Y}:\n{row['snippet']}")
+        buttons.append([InlineKeyboardButton(
+            text=f"📄 @{row['username']} {row['date']:%d.%m.%Y}",
+            callback_data=DatePick(user_id=row["user_id"], day=row["date"].strftime("%Y%m%d")).pack()
+        )])
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=SearchPage(page=page - 1).pack()))
+    if has_more:
+        navigation.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=SearchPage(page=page + 1).pack()))
+    if navigation:
+        buttons.append(navigation)
+    return "\n".join(lines)[:MESSAGE_LIMIT], InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# 📌 /search <запрос> [@username] [даты] — полнотекстовый поиск с ранжированием
+@router.message(Command("search"))
+async def search_command(message: Message, command: CommandObject, state: FSMContext):
+    query, username, start, end = search.parse_search_args(command.args or "")
+    if not query:
+        await message.answer(SEARCH_USAGE)
+        return
+    try:
+        user_id = None
+        if username:
+            user_id = await db.find_user_id(username)
+            if user_id is None:
+                await message.answer(f"❌ Пользователь @{username} не найден.")
+                return
+        params = {
+            "query": query,
+            "user_id": user_id,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+        }
+        # Параметры поиска нужны кнопкам листания; состояние FSM не меняем
+        await state.update_data(search=params)
+        text, keyboard = await build_results_page(params, 0)
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        logging.error(f"Ошибка поиска: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
+
+
+@router.callback_query(SearchPage.filter())
+async def search_page(callback: CallbackQuery, callback_data: SearchPage, state: FSMContext):
+    params = (await state.get_data()).get("search")
+    if not params:
+        await callback.answer("⌛ Поиск устарел, повтори /search", show_alert=True)
+        return
+    text, keyboard = await build_results_page(params, callback_data.page)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# 📌 Inline-режим: @бот <запрос> в любом чате (нужно включить /setinline у BotFather)
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    query, username, start, end = search.parse_search_args(inline_query.query)
+    if not query:
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+    offset = int(inline_query.offset or 0)
+    user_id = await db.find_user_id(username) if username else None
+    if username and user_id is None:
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+
+    rows, has_more = await search.search_reports(query, user_id, start, end, limit=INLINE_PAGE_SIZE, offset=offset)
+    results = [
+        InlineQueryResultArticle(
+            id=f"{row['user_id']}:{row['date']:%Y%m%d}",
+            title=f"@{row['username']} — {row['date']:%d.%m.%Y}",
+            description=row["snippet"],
+            input_message_content=InputTextMessageContent(
+                message_text=f"📝 Отчёт @{row['username']} за {row['date']}:\n{row['text']}"[:MESSAGE_LIMIT]
+            ),
+        )
+        for row in rows
+    ]
+    await inline_query.answer(
+        results, cache_time=30, is_personal=True, next_offset=str(offset + INLINE_PAGE_SIZE) if has_more else ""
+    )
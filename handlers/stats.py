@@ -0,0 +1,32 @@
+import logging
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+import db
+import analytics
+from handlers.common import today
+
+router = Router(name="stats")
+
+
+# 📌 /stats — сводка по команде за неделю, /stats @username — по одному пользователю
+@router.message(Command("stats"))
+async def stats_command(message: Message, command: CommandObject):
+    username = (command.args or "").strip().lstrip("@")
+    try:
+        if not username:
+            active, users, per_day = await analytics.team_stats(today())
+            await message.answer(analytics.format_team_stats(active, users, per_day))
+            return
+
+        user_id = await db.find_user_id(username)
+        stats = await analytics.user_stats(user_id, today()) if user_id is not None else None
+        if stats is None:
+            await message.answer(f"❌ У @{username} пока нет отчётов.")
+            return
+        await message.answer(analytics.format_user_stats(stats))
+    except Exception as e:
+        logging.error(f"Ошибка статистики: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
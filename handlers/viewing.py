@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime, timedelta
+
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+import db
+import cache
+from handlers.common import UsersPage, UserPick, DatePick, USERS_PAGE_SIZE, MAX_PREFIX_LENGTH, today
+
+router = Router(name="viewing")
+# Колбэки этого роутера: кнопка меню и префиксы CallbackData (плюс устаревшие кнопки)
+VIEW_PREFIXES = (f"{UsersPage.__prefix__}:", f"{UserPick.__prefix__}:", f"{DatePick.__prefix__}:", "user_", "date_")
+router.callback_query.filter((F.data == "get") | F.data.startswith(VIEW_PREFIXES))
+
+
+# 📌 Команда /get (или кнопка "📊 Запросить отчёт"), /get <начало username> — поиск
+@router.message(Command("get"))
+@router.message(F.text == "📊 Запросить отчёт")
+async def get_report_command(message: Message):
+    parts = (message.text or "").split(maxsplit=1)
+    prefix = ""
+    if parts and parts[0].startswith("/get") and len(parts) > 1:
+        prefix = normalize_prefix(parts[1])
+
+    try:
+        text, keyboard = await build_users_page(prefix, None, backward=False)
+        if keyboard is None:
+            await message.answer(text)
+            return
+        await message.answer(text, reply_markup=keyboard)
+
+    except Exception as e:
+        logging.error(f"Ошибка БД: {e}")
+        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
+
+
+@router.callback_query(F.data == "get")
+async def get_callback(callback: CallbackQuery):
+    await callback.answer()
+    await get_report_command(callback.message)
+
+
+# Username в Telegram — латиница, цифры и "_"; остальное из запроса отбрасываем
+def normalize_prefix(text):
+    text = text.strip().lstrip("@").lower()
+    return "".join(ch for ch in text if ch.isascii() and (ch.isalnum() or ch == "_"))[:MAX_PREFIX_LENGTH]
+
+
+async def build_users_page(prefix, cursor, backward):
+    users, has_more = await cache.get_users_page(prefix, cursor, backward, USERS_PAGE_SIZE)
+    if not users:
+        if prefix:
+            return f"❌ Нет пользователей, начинающихся на «{prefix}».", None
+        return "❌ Нет доступных пользователей.", None
+
+    buttons = [
+        InlineKeyboardButton(text=f"@{username}", callback_data=UserPick(user_id=user_id).pack())
+        for user_id, username in users
+    ]
+    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+    # Предыдущая страница есть, если листали вперёд с курсора или назад и там ещё остались записи
+    has_prev = has_more if backward else cursor is not None
+    has_next = cursor is not None if backward else has_more
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            text="◀️ Назад", callback_data=UsersPage(backward=True, cursor=users[0][0], prefix=prefix).pack()
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text="Вперёд ▶️", callback_data=UsersPage(backward=False, cursor=users[-1][0], prefix=prefix).pack()
+        ))
+    if navigation:
+        rows.append(navigation)
+
+    title = f"👤 Выбери пользователя (поиск: «{prefix}»):" if prefix else "👤 Выбери пользователя:"
+    return title, InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+# 📌 Листание списка пользователей
+@router.callback_query(UsersPage.filter())
+async def users_page(callback: CallbackQuery, callback_data: UsersPage):
+    text, keyboard = await build_users_page(callback_data.prefix or "", callback_data.cursor, callback_data.backward)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# "31 Янв (Ср)" без locale.setlocale
+MONTHS = ["Янв", "Фев", "Мар", "Апр", "Мая", "Июн", "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"]
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def format_day(day):
+    return f"{day.day:02d} {MONTHS[day.month - 1]} ({WEEKDAYS[day.weekday()]})"
+
+
+# 📌 Обработчик выбора пользователя: 7 дней выбранной недели (week=0 — последние 7 дней)
+@router.callback_query(UserPick.filter())
+async def select_user(callback: CallbackQuery, callback_data: UserPick):
+    last_day = today() - timedelta(weeks=callback_data.week)
+    first_day = last_day - timedelta(days=6)
+
+    # Один запрос по индексу (user_id, date): username и дни, за которые есть отчёты
+    row = await db.fetchrow("""
+        SELECT u.username,
+               ARRAY(SELECT date FROM reports WHERE user_id = u.user_id AND date BETWEEN $2 AND $3) AS dates
+        FROM bot_users u
+        WHERE u.user_id = $1
+    """, callback_data.user_id, first_day, last_day)
+    if row is None:
+        await callback.answer("❌ Пользователь не найден.", show_alert=True)
+        return
+    reported = set(row["dates"])
+
+    days = [last_day - timedelta(days=i) for i in range(7)]
+    buttons = [
+        InlineKeyboardButton(
+            text=("✅ " if day in reported else "") + format_day(day),
+            callback_data=DatePick(user_id=callback_data.user_id, day=day.strftime("%Y%m%d")).pack()
+        )
+        for day in days
+    ]
+    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+    navigation = [InlineKeyboardButton(
+        text="◀️ Неделя раньше", callback_data=UserPick(user_id=callback_data.user_id, week=callback_data.week + 1).pack()
+    )]
+    if callback_data.week > 0:
+        navigation.append(InlineKeyboardButton(
+            text="Неделя позже ▶️", callback_data=UserPick(user_id=callback_data.user_id, week=callback_data.week - 1).pack()
+        ))
+    rows.append(navigation)
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=rows)
+    text = f"📅 Выбран пользователь: @{row['username']}\nВыбери дату отчёта:"
+    # Листание недель правит то же сообщение, выбор пользователя — присылает новое
+    if (callback.message.text or "").startswith("📅"):
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    else:
+        await callback.message.answer(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# 📌 Обработчик выбора даты
+@router.callback_query(DatePick.filter())
+async def select_date(callback: CallbackQuery, callback_data: DatePick):
+    day = datetime.strptime(callback_data.day, "%Y%m%d").date()
+    username, record = await cache.get_report(callback_data.user_id, day)
+
+    if record is not None:
+        await callback.message.answer(f"📝 Отчёт @{username} за {day}:\n{record}")
+    else:
+        await callback.message.answer(f"❌ Нет отчётов @{username} за {day}.")
+    await callback.answer()
+
+
+# Кнопки из старых сообщений (до постраничного /get)
+@router.callback_query(F.data.startswith(("user_", "date_")))
+async def legacy_picker(callback: CallbackQuery):
+    await callback.answer("⌛ Эта кнопка устарела, запроси отчёт заново: /get", show_alert=True)
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware
+
+import db
+
+# Перезапуск упавшей фоновой задачи: пауза растёт от BACKOFF_MIN до BACKOFF_MAX секунд
+# и сбрасывается, если задача успела проработать дольше BACKOFF_RESET
+BACKOFF_MIN = float(os.getenv("BACKOFF_MIN", "0.5"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "60"))
+BACKOFF_RESET = float(os.getenv("BACKOFF_RESET", "300"))
+# Сколько секунд ждём обработки уже полученных апдейтов при остановке
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+# Как часто записывать обработанные update_id в processed_updates (секунды)
+PROCESSED_UPDATES_INTERVAL = float(os.getenv("PROCESSED_UPDATES_INTERVAL", "1"))
+
+
+# 📌 Фоновая задача под присмотром: падение -> лог и перезапуск с экспоненциальной паузой.
+# Обычное завершение корутины — штатная остановка, повторно не запускаем
+async def supervise(name: str, factory: Callable[[], Awaitable], min_delay: float = BACKOFF_MIN,
+                    max_delay: float = BACKOFF_MAX):
+    delay = min_delay
+    while True:
+        started = time.monotonic()
+        try:
+            return await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if time.monotonic() - started > BACKOFF_RESET:
+                delay = min_delay
+            logging.error(f"❌ Задача {name} упала: {e!r}, перезапуск через {delay:.1f} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+class Lifecycle:
+    """
+    Единое место, где открываются и закрываются ресурсы процесса.
+
+    Ресурсы регистрируются по мере открытия (on_close) и закрываются в обратном
+    порядке: сначала фоновые задачи, затем то, что открыли последним, и в конце
+    пул БД. Ошибка при закрытии одного ресурса не мешает закрыть остальные.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.closers: List[tuple] = []
+
+    def on_close(self, name: str, callback: Callable[[], Awaitable]):
+        self.closers.append((name, callback))
+
+    def start_task(self, name: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        task = self.tasks.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(supervise(name, factory), name=name)
+            self.tasks[name] = task
+        return task
+
+    async def close(self):
+        tasks, self.tasks = list(self.tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        closers, self.closers = self.closers, []
+        for name, callback in reversed(closers):
+            try:
+                await callback()
+            except Exception as e:
+                logging.error(f"Ошибка при закрытии {name}: {e}")
+
+
+RECORD_PROCESSED_UPDATES = """
+    INSERT INTO processed_updates (update_id) SELECT unnest($1::bigint[])
+    ON CONFLICT DO NOTHING
+"""
+
+
+class DeduplicateUpdatesMiddleware(BaseMiddleware):
+    """
+    Повторно доставленные апдейты не обрабатываем дважды.
+
+    Обработанные update_id раз в PROCESSED_UPDATES_INTERVAL секунд пачкой пишутся
+    в processed_updates (после load(); при остановке — flush()), а при старте последние
+    из них поднимаются в память. Так повтор отсекается и после перезапуска, когда Telegram
+    заново присылает неподтверждённую пачку; без записи остаются только апдейты, обработанные
+    за последний интервал перед аварийным падением процесса. Заодно знаем, до какого
+    update_id обработка точно завершилась (см. confirmed_offset).
+    """
+
+    def __init__(self, size: int = 10_000, interval: float = PROCESSED_UPDATES_INTERVAL):
+        self.seen: set = set()
+        self.order: deque = deque()
+        self.size = size
+        self.interval = interval
+        self.in_progress: set = set()
+        self.last_finished_id = 0
+        # Обработаны, но ещё не записаны в processed_updates
+        self.unrecorded: list = []
+        # Без load() (бенчмарки без БД) помним апдейты только в памяти
+        self.persistent = False
+
+    def _remember(self, update_id):
+        self.seen.add(update_id)
+        self.order.append(update_id)
+        if len(self.order) > self.size:
+            self.seen.discard(self.order.popleft())
+
+    async def load(self):
+        # Telegram хранит неподтверждённые апдейты не дольше суток
+        await db.execute("DELETE FROM processed_updates WHERE processed_at < now() - interval '1 day'")
+        rows = await db.fetch(
+            "SELECT update_id FROM processed_updates ORDER BY update_id DESC LIMIT $1", self.size
+        )
+        for row in reversed(rows):
+            self._remember(row["update_id"])
+        self.persistent = True
+
+    def confirmed_offset(self) -> int | None:
+        """Offset для getUpdates, подтверждающий только полностью обработанные апдейты."""
+        if self.in_progress:
+            return min(self.in_progress)
+        return self.last_finished_id + 1 if self.last_finished_id else None
+
+    async def __call__(self, handler, event, data):
+        update_id = event.update_id
+        if update_id in self.seen:
+            logging.info(f"Пропущен повторный апдейт {update_id}")
+            return None
+        self._remember(update_id)
+        self.in_progress.add(update_id)
+        finished = False
+        try:
+            result = await handler(event, data)
+            finished = True
+            return result
+        except Exception:
+            # Ошибка хендлера — апдейт всё равно обработан, повтор его не исправит
+            finished = True
+            raise
+        finally:
+            self.in_progress.discard(update_id)
+            if finished:
+                self.last_finished_id = max(self.last_finished_id, update_id)
+                if self.persistent:
+                    self.unrecorded.append(update_id)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.unrecorded:
+            return
+        batch, self.unrecorded = self.unrecorded, []
+        try:
+            await db.execute(RECORD_PROCESSED_UPDATES, batch)
+        except BaseException:
+            # Ошибка или отмена посреди записи: отметки вернутся в следующую пачку
+            self.unrecorded[:0] = batch
+            raise
+
+
+# 📌 Дожидаемся апдейтов, которые aiogram уже запустил задачами, но не успел обработать.
+# Возвращает False, если за timeout обработались не все
+async def drain_updates(dp, timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> bool:
+    # У Dispatcher нет публичного API для этого; polling держит задачи апдейтов здесь
+    tasks = [task for task in getattr(dp, "_handle_update_tasks", ()) if not task.done()]
+    if not tasks:
+        return True
+    logging.info(f"⏳ Дорабатываем {len(tasks)} апдейтов перед остановкой")
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    if pending:
+        # Апдейты из уже подтверждённых пачек Telegram не пришлёт повторно
+        logging.warning(f"Не успели обработать {len(pending)} апдейтов при остановке, часть из них может потеряться")
+        return False
+    return True
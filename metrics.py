@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import signal
+import asyncio
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache, wraps
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter as PromCounter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess, start_http_server
+
+# Порт /metrics в режиме polling (в webhook-режиме /metrics отдаёт FastAPI)
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Профилировщик медленных апдейтов: включён ли при старте, порог и шаг выборки (секунды)
+SLOW_UPDATE_PROFILING = os.getenv("SLOW_UPDATE_PROFILING", "0") == "1"
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "1"))
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+UPDATE_LATENCY = Histogram(
+    "bot_update_duration_seconds", "Полное время обработки апдейта", ["event"], buckets=LATENCY_BUCKETS
+)
+UPDATE_ERRORS = PromCounter("bot_update_errors_total", "Апдейты, завершившиеся исключением", ["event"])
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Время работы хендлера", ["handler"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    "bot_db_query_duration_seconds", "Время запроса к PostgreSQL", ["statement"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_ERRORS = PromCounter("bot_db_query_errors_total", "Ошибки запросов к PostgreSQL", ["statement"])
+TELEGRAM_API_CALLS = PromCounter("bot_telegram_api_calls_total", "Вызовы Bot API", ["method", "status"])
+TELEGRAM_API_LATENCY = Histogram(
+    "bot_telegram_api_duration_seconds", "Время вызова Bot API", ["method"], buckets=LATENCY_BUCKETS
+)
+TELEGRAM_API_RETRIES = PromCounter("bot_telegram_api_retry_after_total", "Ответы flood control (RetryAfter)", ["method"])
+JOB_DURATION = Histogram(
+    "bot_job_duration_seconds", "Время выполнения задач планировщика", ["job"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+JOB_ERRORS = PromCounter("bot_job_errors_total", "Ошибки задач планировщика", ["job"])
+# Кэши cache.py: по попаданиям, промахам и вытеснениям подбираются USERS_CACHE_SIZE/REPORTS_CACHE_SIZE
+CACHE_REQUESTS = PromCounter("bot_cache_requests_total", "Чтения из кэша", ["cache", "result"])
+CACHE_EVICTIONS = PromCounter("bot_cache_evictions_total", "Вытеснения из кэша из-за размера", ["cache"])
+CACHE_ENTRIES = Gauge("bot_cache_entries", "Записей в кэше", ["cache"], multiprocess_mode="livesum")
+REPORT_WRITE_BATCH = Histogram(
+    "bot_report_write_batch_size", "Сколько отчётов записано одной пачкой",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500, 1000)
+)
+
+
+# 📌 Имя запроса для метрик: "select reports", "insert bot_users" и т.п.
+STATEMENT_RE = re.compile(
+    r"\b(?:(select|delete)\b.*?\bfrom\s+(\w+)|(insert)\s+into\s+(\w+)|(update)\s+(?!set\b)(\w+))", re.I | re.S
+)
+
+
+@lru_cache(maxsize=256)
+def statement_name(query: str) -> str:
+    matches = list(STATEMENT_RE.finditer(query))
+    if not matches:
+        return query.split(None, 1)[0].lower() if query.strip() else "empty"
+    # В запросах с CTE главный — последний оператор
+    match = matches[-1] if query.lstrip()[:4].lower() == "with" else matches[0]
+    verb, table = [group for group in match.groups() if group]
+    return f"{verb.lower()} {table.lower()}"
+
+
+@asynccontextmanager
+async def track_query(query: str):
+    name = statement_name(query)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(name).inc()
+        raise
+    finally:
+        DB_QUERY_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+# 📌 Длительность задач планировщика
+def timed_job(name: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                JOB_ERRORS.labels(name).inc()
+                raise
+            finally:
+                JOB_DURATION.labels(name).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class SlowUpdateProfiler:
+    """
+    Сэмплирующий профилировщик: фоновый поток раз в ``interval`` секунд снимает
+    стек потока event loop в кольцевой буфер. Если апдейт обрабатывался дольше
+    ``threshold``, в лог пишутся самые частые стеки за время его обработки.
+    Включается и выключается на лету (enable/disable).
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, threshold: float = SLOW_UPDATE_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: deque = deque(maxlen=20_000)
+        self.thread_id: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def enable(self):
+        # Вызывать из потока event loop — его и профилируем
+        if self.enabled:
+            return
+        self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-update-profiler", daemon=True)
+        self._thread.start()
+        logging.info(f"🔬 Профилировщик медленных апдейтов включён (порог {self.threshold} с)")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.samples.clear()
+        logging.info("🔬 Профилировщик медленных апдейтов выключен")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 30:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(stack)))
+
+    def report(self, event: str, started: float, finished: float):
+        if finished - started < self.threshold:
+            return
+        window = Counter(stack for at, stack in list(self.samples) if started <= at <= finished)
+        total = sum(window.values())
+        if not total:
+            return
+        lines = [f"🐢 Медленный апдейт ({event}): {finished - started:.2f} с, {total} сэмплов"]
+        for stack, hits in window.most_common(5):
+            lines.append(f"  {hits / total:.0%}: " + " <- ".join(stack[:8]))
+        logging.warning("\n".join(lines))
+
+
+profiler = SlowUpdateProfiler()
+
+
+# 📌 Outer-middleware на dp.update: полное время апдейта, ошибки, медленные апдейты
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        event_type = event.event_type
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.labels(event_type).inc()
+            raise
+        finally:
+            finished = time.perf_counter()
+            UPDATE_LATENCY.labels(event_type).observe(finished - started)
+            if profiler.enabled:
+                profiler.report(event_type, started, finished)
+
+
+# Inner-middleware на наблюдателях событий: здесь уже известен выбранный хендлер
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+# 📌 Middleware сессии: вызовы Bot API, их время, RetryAfter и ошибки
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_API_RETRIES.labels(name).inc()
+            TELEGRAM_API_CALLS.labels(name, "retry_after").inc()
+            raise
+        except Exception as e:
+            TELEGRAM_API_CALLS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.labels(name).observe(time.perf_counter() - started)
+        TELEGRAM_API_CALLS.labels(name, "ok").inc()
+        return response
+
+
+def setup(dp, bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(TelegramApiMetricsMiddleware())
+
+
+def start_profiler_if_configured():
+    if SLOW_UPDATE_PROFILING:
+        profiler.enable()
+    # Переключение на лету в любом режиме: kill -USR1 <pid> (в webhook-режиме есть ещё /debug/profiler).
+    # Обработчик сигнала выполняется в потоке event loop, как и требует enable()
+    if hasattr(signal, "SIGUSR1"):  # На Windows такого сигнала нет
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiler)
+
+
+def toggle_profiler():
+    if profiler.enabled:
+        profiler.disable()
+    else:
+        profiler.enable()
+
+
+# 📌 Экспорт метрик в формате Prometheus
+def render() -> tuple[bytes, str]:
+    # При нескольких воркерах uvicorn метрики собираются из PROMETHEUS_MULTIPROC_DIR
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+_metrics_server_started = False
+
+
+def start_metrics_server():
+    global _metrics_server_started
+    if METRICS_PORT and not _metrics_server_started:
+        start_http_server(int(METRICS_PORT))
+        _metrics_server_started = True
+        logging.info(f"📈 /metrics слушает порт {METRICS_PORT}")
@@ -0,0 +1,300 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from datetime import datetime, time as dt_time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+import db
+import metrics
+from lifecycle import supervise
+
+# Параметры рассылки (можно переопределить через переменные окружения)
+REMINDER_TEXT = "📝 Что ты сегодня делал? Напиши /report"
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "20"))
+# Telegram разрешает ~30 сообщений в секунду на бота — держим небольшой запас
+REMINDER_GLOBAL_RATE = float(os.getenv("REMINDER_GLOBAL_RATE", "25"))
+# Не чаще одного сообщения в секунду в один чат
+REMINDER_PER_CHAT_INTERVAL = float(os.getenv("REMINDER_PER_CHAT_INTERVAL", "1"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+REMINDER_BATCH_SIZE = 500
+# Значения по умолчанию для пользователей, не менявших настройки
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+DEFAULT_REMIND_AT = dt_time.fromisoformat(os.getenv("DEFAULT_REMIND_AT", "18:00"))
+# Окно подгрузки из БД, разброс отправки и сколько можно опоздать (секунды)
+REMINDER_WINDOW = float(os.getenv("REMINDER_WINDOW", "300"))
+REMINDER_SPREAD = int(os.getenv("REMINDER_SPREAD", "120"))
+REMINDER_MAX_LATENESS = timedelta(seconds=float(os.getenv("REMINDER_MAX_LATENESS", "7200")))
+
+SETTINGS_COLUMNS = "enabled, remind_at, timezone, weekdays, snoozed_until"
+
+
+class TokenBucket:
+    """Ведро токенов: не больше `rate` операций в секунду, всплеск до `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        # После TelegramRetryAfter останавливаем всех отправителей сразу
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Общий лимит бота плюс минимальный интервал между сообщениями в один чат."""
+
+    def __init__(self, global_rate: float, per_chat_interval: float):
+        self.bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.last_sent: dict[int, float] = {}
+
+    def pause(self, seconds: float):
+        self.bucket.pause(seconds)
+
+    async def acquire(self, chat_id: int):
+        last = self.last_sent.get(chat_id)
+        if last is not None:
+            wait = last + self.per_chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await self.bucket.acquire()
+        self.last_sent[chat_id] = time.monotonic()
+
+
+async def send_with_retry(bot: Bot, limiter: RateLimiter, chat_id: int, text: str):
+    """Отправляет сообщение, возвращает (status, error)."""
+    for attempt in range(1, REMINDER_MAX_ATTEMPTS + 1):
+        await limiter.acquire(chat_id)
+        try:
+            await bot.send_message(chat_id, text)
+            return "sent", None
+        except TelegramRetryAfter as e:
+            logging.warning(f"⏳ Flood control: ждём {e.retry_after} с (попытка {attempt})")
+            limiter.pause(e.retry_after)
+        except TelegramForbiddenError as e:
+            return "blocked", str(e)
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                return "blocked", str(e)
+            return "error", str(e)
+        except Exception as e:
+            logging.error(f"Ошибка отправки уведомления {chat_id}: {e}")
+            if attempt == REMINDER_MAX_ATTEMPTS:
+                return "error", str(e)
+            await asyncio.sleep(2 ** attempt)
+    return "error", "retry limit exceeded"
+
+
+async def save_outcomes(outcomes: list):
+    if not outcomes:
+        return
+    async with db.transaction() as conn:
+        await conn.executemany(
+            "INSERT INTO reminder_deliveries (user_id, status, error) VALUES ($1, $2, $3)",
+            outcomes,
+        )
+        blocked = [user_id for user_id, status, _ in outcomes if status == "blocked"]
+        if blocked:
+            # Заблокировавших бота пропускаем в следующих рассылках
+            await conn.execute(
+                "UPDATE bot_users SET is_active = FALSE, updated_at = now() WHERE user_id = ANY($1::bigint[])",
+                blocked,
+            )
+
+
+# 📌 Расчёт следующего напоминания с учётом часового пояса, дней недели и «отложить»
+def next_fire_time(settings, after: datetime) -> datetime | None:
+    if not settings["enabled"] or not settings["weekdays"]:
+        return None
+    zone = ZoneInfo(settings["timezone"] or DEFAULT_TIMEZONE)
+    remind_at = settings["remind_at"] or DEFAULT_REMIND_AT
+    snoozed_until = settings["snoozed_until"]
+    if snoozed_until is not None and snoozed_until > after:
+        after = snoozed_until
+    local = after.astimezone(zone)
+    for offset in range(8):
+        day = local.date() + timedelta(days=offset)
+        if not settings["weekdays"] & (1 << day.weekday()):
+            continue
+        candidate = datetime.combine(day, remind_at, tzinfo=zone)
+        if candidate > local:
+            return candidate.astimezone(timezone.utc)
+    return None
+
+
+# 📌 Изменение настроек пользователя с пересчётом next_fire_at
+SETTINGS_FIELDS = {"enabled", "remind_at", "timezone", "weekdays", "snoozed_until"}
+
+
+async def get_settings(user_id):
+    return await db.fetchrow(f"SELECT {SETTINGS_COLUMNS}, next_fire_at FROM reminder_settings WHERE user_id = $1", user_id)
+
+
+async def update_settings(user_id, **changes):
+    unknown = set(changes) - SETTINGS_FIELDS
+    if unknown:
+        raise ValueError(f"Неизвестные настройки: {unknown}")
+    async with db.transaction() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {SETTINGS_COLUMNS} FROM reminder_settings WHERE user_id = $1 FOR UPDATE", user_id
+        )
+        if row is None:
+            return None
+        settings = dict(row)
+        settings.update(changes)
+        settings["next_fire_at"] = next_fire_time(settings, datetime.now(timezone.utc))
+        assignments = ", ".join(f"{name} = ${i}" for i, name in enumerate(settings, start=2))
+        await conn.execute(
+            f"UPDATE reminder_settings SET {assignments} WHERE user_id = $1", user_id, *settings.values()
+        )
+    return settings
+
+
+class ReminderScheduler:
+    """
+    Персональные напоминания. Раз в полокна из БД подгружаются напоминания,
+    которые наступят в ближайшие ``window`` секунд, и кладутся в кучу по времени
+    срабатывания; цикл достаёт из кучи наступившие и отправляет их.
+
+    Перед отправкой next_fire_at атомарно сдвигается на следующий раз
+    (UPDATE ... WHERE next_fire_at = <старое значение>), поэтому после перезапуска
+    или при нескольких процессах одно напоминание не уходит дважды.
+    """
+
+    def __init__(self, bot: Bot, window: float = REMINDER_WINDOW):
+        self.bot = bot
+        self.window = window
+        self.heap: list = []
+        self.queued: set = set()
+        self.limiter = RateLimiter(REMINDER_GLOBAL_RATE, REMINDER_PER_CHAT_INTERVAL)
+        self.semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY)
+        self.tasks: set = set()
+        self.outcomes: list = []
+        self._runner: asyncio.Task | None = None
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(supervise("reminders", self.run))
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.flush()
+
+    async def run(self):
+        next_load = last_flush = 0.0
+        while True:
+            now = time.time()
+            if now >= next_load:
+                try:
+                    await self.load_window()
+                except Exception as e:
+                    logging.error(f"Ошибка загрузки напоминаний: {e}")
+                next_load = now + self.window / 2
+
+            while self.heap and self.heap[0][0] <= time.time():
+                _, user_id, fire_at, settings = heapq.heappop(self.heap)
+                self.queued.discard((user_id, fire_at))
+                task = asyncio.create_task(self.fire(user_id, fire_at, settings))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            if self.outcomes and (len(self.outcomes) >= REMINDER_BATCH_SIZE or now - last_flush > 5):
+                await self.flush()
+                last_flush = now
+
+            wake_at = min(next_load, self.heap[0][0]) if self.heap else next_load
+            await asyncio.sleep(min(max(wake_at - time.time(), 0), 1))
+
+    async def load_window(self):
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+
+        # Новым пользователям (и после миграции) считаем первое напоминание
+        unscheduled = await db.fetch(
+            f"SELECT user_id, {SETTINGS_COLUMNS} FROM reminder_settings "
+            "WHERE enabled AND next_fire_at IS NULL LIMIT 1000"
+        )
+        updates = [
+            (row["user_id"], next_fire_time(row, now)) for row in unscheduled
+        ]
+        updates = [(user_id, fire_at) for user_id, fire_at in updates if fire_at is not None]
+        if updates:
+            await db.executemany(
+                "UPDATE reminder_settings SET next_fire_at = $2 WHERE user_id = $1 AND next_fire_at IS NULL", updates
+            )
+
+        rows = await db.fetch(f"""
+            SELECT s.user_id, s.next_fire_at, {", ".join("s." + c for c in SETTINGS_COLUMNS.split(", "))}
+            FROM reminder_settings s
+            JOIN bot_users u ON u.user_id = s.user_id
+            WHERE s.enabled AND s.next_fire_at < $1 AND u.is_active
+        """, now + timedelta(seconds=self.window))
+        added = 0
+        for row in rows:
+            key = (row["user_id"], row["next_fire_at"])
+            if key in self.queued:
+                continue
+            self.queued.add(key)
+            # Детерминированный разброс, чтобы «18:00» у всех не превращалось в один всплеск
+            fire_ts = row["next_fire_at"].timestamp() + row["user_id"] % (REMINDER_SPREAD + 1)
+            heapq.heappush(self.heap, (fire_ts, row["user_id"], row["next_fire_at"], dict(row)))
+            added += 1
+        metrics.JOB_DURATION.labels("reminder_window").observe(time.monotonic() - started)
+        if added:
+            logging.info(f"⏰ Запланировано напоминаний: {added} (в очереди {len(self.heap)})")
+
+    async def fire(self, user_id, fire_at, settings):
+        async with self.semaphore:
+            now = datetime.now(timezone.utc)
+            next_at = next_fire_time(settings, max(now, fire_at))
+            claimed = await db.fetchval(
+                "UPDATE reminder_settings SET next_fire_at = $3, last_sent_at = now() "
+                "WHERE user_id = $1 AND next_fire_at = $2 RETURNING user_id",
+                user_id, fire_at, next_at,
+            )
+            if claimed is None:
+                # Уже отправлено другим процессом или пользователь поменял настройки
+                return
+            if now - fire_at > REMINDER_MAX_LATENESS:
+                logging.info(f"Пропущено устаревшее напоминание {user_id} за {fire_at}")
+                return
+            status, error = await send_with_retry(self.bot, self.limiter, user_id, REMINDER_TEXT)
+            self.outcomes.append((user_id, status, error))
+
+    async def flush(self):
+        batch, self.outcomes = self.outcomes, []
+        try:
+            await save_outcomes(batch)
+        except Exception as e:
+            logging.error(f"Ошибка записи результатов рассылки: {e}")
@@ -0,0 +1,186 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import db
+import cache
+import metrics
+from lifecycle import supervise
+
+# Пачка пишется в БД, когда накопилось REPORT_WRITE_BATCH_SIZE изменений или прошло REPORT_WRITE_INTERVAL секунд
+REPORT_WRITE_BATCH_SIZE = int(os.getenv("REPORT_WRITE_BATCH_SIZE", "200"))
+# 0 — сквозная запись до ответа пользователю (по умолчанию при нескольких процессах: очередь
+# одного процесса не видна другим, и порядок изменений одного отчёта иначе не гарантирован)
+REPORT_WRITE_INTERVAL = float(os.getenv("REPORT_WRITE_INTERVAL", "0" if db.MULTI_PROCESS else "0.5"))
+# Сверх этого числа несохранённых изменений обработчик ждёт записи (обратное давление)
+REPORT_WRITE_MAX_PENDING = int(os.getenv("REPORT_WRITE_MAX_PENDING", "5000"))
+
+DELETE_REPORTS = """
+    DELETE FROM reports
+    WHERE (user_id, date) IN (SELECT * FROM unnest($1::bigint[], $2::date[]))
+"""
+
+
+@dataclass
+class PendingWrite:
+    # "replace" — заменить отчёт, "append" — дописать к тому, что в БД, "delete" — удалить
+    action: str
+    username: Optional[str] = None
+    text: Optional[str] = None
+
+
+def combine(older: PendingWrite, newer: PendingWrite) -> PendingWrite:
+    """Склеивает два последовательных изменения одного отчёта в одно."""
+    if newer.action != "append":
+        return newer
+    if older.action == "delete":
+        return PendingWrite("replace", newer.username, newer.text)
+    return PendingWrite(older.action, newer.username, f"{older.text}\n{newer.text}")
+
+
+class ReportWriter:
+    """
+    Отложенная запись отчётов. Обработчик ставит изменение в очередь и сразу отвечает,
+    а фоновая задача пишет накопленное пачкой: все замены одним executemany, все
+    дописывания другим, удаления одним DELETE — в одной транзакции.
+
+    Изменения одного отчёта (user_id, date) склеиваются по порядку поступления
+    (combine), поэтому в БД всегда попадает результат последней операции. Пока
+    изменение не записано, current_text() учитывает его при чтении. При ошибке
+    пачка возвращается в очередь перед более новыми изменениями.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = REPORT_WRITE_BATCH_SIZE,
+        interval: float = REPORT_WRITE_INTERVAL,
+        max_pending: int = REPORT_WRITE_MAX_PENDING,
+    ) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[int, object], PendingWrite] = {}
+        # Пачка, которая пишется прямо сейчас (в БД её ещё не видно)
+        self.in_flight: Dict[Tuple[int, object], PendingWrite] = {}
+        self._wakeup = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+
+    async def replace(self, user_id, username, text, day):
+        if text is None:
+            raise ValueError("Текст отчёта не может быть пустым")
+        await self._submit(user_id, day, PendingWrite("replace", username, text))
+
+    async def append(self, user_id, username, text, day):
+        if text is None:
+            raise ValueError("Текст отчёта не может быть пустым")
+        await self._submit(user_id, day, PendingWrite("append", username, text))
+
+    async def delete(self, user_id, username, day):
+        await self._submit(user_id, day, PendingWrite("delete", username))
+
+    async def _submit(self, user_id, day, write: PendingWrite):
+        while len(self.pending) >= self.max_pending:
+            self._wakeup.set()
+            self._flushed.clear()
+            await self._flushed.wait()
+        key = (user_id, day)
+        older = self.pending.get(key)
+        self.pending[key] = combine(older, write) if older else write
+        cache.invalidate_report(user_id, day)
+        if self.interval <= 0:
+            await self.flush()
+            return
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(supervise("report_writer", self._write_loop))
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _unwritten(self, key) -> Optional[PendingWrite]:
+        older, newer = self.in_flight.get(key), self.pending.get(key)
+        if older and newer:
+            return combine(older, newer)
+        return newer or older
+
+    # 📌 Текст отчёта с учётом ещё не записанных изменений
+    async def current_text(self, user_id, day) -> Optional[str]:
+        write = self._unwritten((user_id, day))
+        if write is not None and write.action != "append":
+            return write.text
+        _, text = await cache.get_report(user_id, day)
+        # Пока ждали БД, изменение могло появиться или уже записаться — смотрим очередь ещё раз
+        write = self._unwritten((user_id, day))
+        if write is None:
+            return text
+        if write.action != "append":
+            return write.text
+        return f"{text}\n{write.text}" if text else write.text
+
+    async def _write_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи отчётов в БД: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                self._flushed.set()
+                return
+            batch, self.pending = self.pending, {}
+            self.in_flight = batch
+            replaces, appends, deletes = [], [], []
+            for (user_id, day), write in batch.items():
+                if write.action == "delete":
+                    deletes.append((user_id, day))
+                else:
+                    target = replaces if write.action == "replace" else appends
+                    target.append((user_id, write.username, write.text, day))
+            try:
+                async with db.transaction() as conn:
+                    if deletes:
+                        await conn.execute(DELETE_REPORTS, *map(list, zip(*deletes)))
+                    if replaces:
+                        await conn.executemany(db.UPSERT_REPORT_REPLACE, replaces)
+                    if appends:
+                        await conn.executemany(db.UPSERT_REPORT_APPEND, appends)
+            except BaseException:
+                # Не потеряли изменения (в том числе при отмене задачи посреди записи):
+                # возвращаем пачку перед пришедшими за это время
+                for key, write in batch.items():
+                    newer = self.pending.get(key)
+                    self.pending[key] = combine(write, newer) if newer else write
+                raise
+            finally:
+                self.in_flight = {}
+                self._flushed.set()
+            metrics.REPORT_WRITE_BATCH.observe(len(batch))
+            # Чтения, начатые до записи, могли положить в кэш старый текст и список авторов без нового
+            for user_id, day in batch:
+                cache.invalidate_report(user_id, day)
+            cache.invalidate_authors(
+                (user_id, write.username, write.action) for (user_id, _), write in batch.items()
+            )
+
+    async def close(self) -> None:
+        # Останавливаем цикл между пачками, а не посреди записи, и дожидаемся его
+        self._stopping = True
+        self._wakeup.set()
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        await self.flush()
+        self._stopping = False
+
+
+writer = ReportWriter()
@@ -0,0 +1,47 @@
+from datetime import date, datetime
+
+import db
+
+# Поиск по GIN-индексу reports_search_vector_idx: websearch_to_tsquery понимает
+# "фразы в кавычках", OR и -исключения. Ранжируем и режем страницу во внутреннем
+# запросе, ts_headline считаем только для строк этой страницы
+SEARCH_QUERY = """
+    SELECT r.user_id, r.username, r.date, r.text,
+           ts_headline('russian', r.text, q, 'MaxWords=25, MinWords=8, MaxFragments=2, StartSel=«, StopSel=»')
+               AS snippet
+    FROM (
+        SELECT id, user_id, username, date, text, ts_rank_cd(search_vector, q) AS rank
+        FROM reports, websearch_to_tsquery('russian', $1) q
+        WHERE search_vector @@ q
+          AND ($2::bigint IS NULL OR user_id = $2)
+          AND ($3::date IS NULL OR date >= $3) AND ($4::date IS NULL OR date <= $4)
+        ORDER BY rank DESC, date DESC, id DESC
+        LIMIT $5 OFFSET $6
+    ) r, websearch_to_tsquery('russian', $1) q
+    ORDER BY r.rank DESC, r.date DESC, r.id DESC
+"""
+
+MAX_QUERY_LENGTH = 200
+
+
+# 📌 "/search деплой @ivan 2024-01-01 2024-03-31" -> запрос, username и границы дат
+def parse_search_args(args: str) -> tuple[str, str | None, date | None, date | None]:
+    words, username, dates = [], None, []
+    for arg in args.split():
+        if arg.startswith("@") and len(arg) > 1:
+            username = arg[1:]
+            continue
+        try:
+            dates.append(datetime.strptime(arg, "%Y-%m-%d").date())
+            continue
+        except ValueError:
+            words.append(arg)
+    start = dates[0] if dates else None
+    end = dates[1] if len(dates) > 1 else None
+    return " ".join(words)[:MAX_QUERY_LENGTH], username, start, end
+
+
+async def search_reports(query: str, user_id=None, start=None, end=None, limit: int = 5, offset: int = 0):
+    """Возвращает (найденные отчёты, есть ли следующая страница)."""
+    rows = await db.fetch(SEARCH_QUERY, query, user_id, start, end, limit + 1, offset)
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,139 @@
+"""
+Webhook-режим: ASGI-приложение (FastAPI) принимает апдейты от Telegram,
+складывает их в ограниченную очередь, а несколько воркеров передают их в dp.feed_update.
+
+Запуск:  python webhook.py
+   или:  WEB_CONCURRENCY=4 uvicorn webhook:app --host 0.0.0.0 --port 8080
+
+Число процессов задаётся только через WEB_CONCURRENCY (uvicorn читает его сам), не флагом
+--workers: при WEB_CONCURRENCY>1 бот отключает локальные кэши FSM и отчётов и пишет
+отчёты в БД сразу (см. db.MULTI_PROCESS), иначе процессы видели бы устаревшее состояние.
+"""
+import os
+import hmac
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from aiogram.types import Update
+
+import bot as telegram_bot
+import metrics
+from lifecycle import SHUTDOWN_DRAIN_TIMEOUT
+
+# ✅ Настройки webhook (из переменных окружения)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес, например https://my-bot.onrender.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+# Сколько процессов uvicorn и сколько обработчиков апдейтов в каждом
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+if not WEBHOOK_URL or not WEBHOOK_SECRET:
+    raise ValueError("Не заданы переменные окружения WEBHOOK_URL и WEBHOOK_SECRET")
+
+bot = telegram_bot.bot
+dp = telegram_bot.dp
+updates: asyncio.Queue | None = None
+
+
+async def update_worker():
+    while True:
+        update = await updates.get()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logging.error(f"Ошибка обработки апдейта {update.update_id}: {e}")
+        finally:
+            updates.task_done()
+
+
+# 📌 Ставим webhook при каждом старте: setWebhook идемпотентен, а по одному URL нельзя понять,
+# совпадают ли секрет и allowed_updates (новый WEBHOOK_SECRET или новые типы апдейтов,
+# например inline_query, иначе не дошли бы до Telegram). Каждый процесс uvicorn ставит одно и то же
+async def set_webhook():
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(100, WEB_CONCURRENCY * UPDATE_WORKERS),
+    )
+    logging.info(f"🌐 Webhook установлен: {url}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global updates
+    updates = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+
+    await telegram_bot.on_startup()
+    await dp.emit_startup(bot=bot)
+    await set_webhook()
+    workers = [asyncio.create_task(update_worker()) for _ in range(UPDATE_WORKERS)]
+
+    try:
+        yield
+    finally:
+        # Дорабатываем уже принятые апдейты, потом останавливаемся
+        try:
+            await asyncio.wait_for(updates.join(), SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не успели обработать {updates.qsize()} апдейтов при остановке")
+        for task in workers:
+            task.cancel()
+        await dp.emit_shutdown(bot=bot)
+        # Сессия бота, пул БД и фоновые задачи закрываются там же, где открывались
+        await telegram_bot.on_shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=401)
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    try:
+        updates.put_nowait(update)
+    except asyncio.QueueFull:
+        # Telegram повторит доставку позже
+        return Response(status_code=503)
+    return Response(status_code=200)
+
+
+@app.get("/")
+async def healthcheck():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+# Включение/выключение профилировщика медленных апдейтов на лету (тот же секрет, что у webhook)
+@app.post("/debug/profiler")
+async def toggle_profiler(request: Request, enabled: bool):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=401)
+    if enabled:
+        metrics.profiler.enable()
+    else:
+        metrics.profiler.disable()
+    return {"enabled": metrics.profiler.enabled}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("webhook:app", host=WEBHOOK_HOST, port=WEBHOOK_PORT, workers=WEB_CONCURRENCY)